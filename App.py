@@ -1,28 +1,134 @@
 import pandas as pd 
 import numpy as np 
-import pickle 
-import urllib
+import os
+import threading
+import time
 import streamlit as st 
-from PIL import Image 
-import base64
-import zipfile
-from sklearn.ensemble import RandomForestClassifier
+import tempfile
+from model_loader import FEATURES, load_classifier
+from batch_predict import score_csv
+from forest_engine import CompiledForest
+from model_artifact import load_forest
+from sweep import MAX_SWEEP_POINTS, coarsen, sweep_proba, sweep_values
+from assets import read_bytes, read_source, render_image
+from metrics import METRICS, MODEL_CACHE_HITS, MODEL_LOAD_SECONDS, MODEL_LOADS, PREDICTIONS, STAGE_SECONDS, configure_from_env, profile_request
+import altair as alt
+
+# heatmaps of large sweeps have more cells than altair embeds by default
+alt.data_transformers.disable_max_rows()
+
+# most values drawn per axis of a sweep chart, more are averaged in runs
+# so the chart renders in well under a second
+MAX_LINE_POINTS = 1000
+MAX_HEATMAP_SIDE = 80
+
+# metrics exporters and the profiling hook are set up once per server from env variables
+configure_from_env()
+
+FEATURE_LABELS = {'issue': 'Issue', 'caseOrigin': 'Case Origin', 'caseSource': 'Case Source', 'certReason': 'Cert Reason',
+                  'lawType': 'Law Type', 'naturalCourt': 'Natural Court', 'adminAction': 'Admin Action'}
   
+# st.cache puts the current value of everything a cached function refers to in
+# its key, metrics included, so cached loads only time themselves and the
+# callers count them. The first caller to see a load counts it, every later
+# one counts a cache hit
+def timed_load(load, *args):
+    start = time.perf_counter()
+    return {'model': load(*args), 'seconds': time.perf_counter() - start, 'fresh': True}
+
+def count_load(loaded, name):
+    if loaded.pop('fresh', False):
+        METRICS.inc(MODEL_LOADS, model=name)
+        METRICS.observe(MODEL_LOAD_SECONDS, loaded['seconds'], model=name)
+    else:
+        METRICS.inc(MODEL_CACHE_HITS, model=name)
+    return loaded['model']
+
 # loading in the model to predict on the data 
 @st.cache(show_spinner=False, allow_output_mutation=True)
+def load_sklearn():
+    return timed_load(load_classifier, 'model.zip')
+
 def get_classifier():
-    archive = zipfile.ZipFile('model.zip', 'r')
-    classifier = pickle.load(archive.open('model.pkl','r'))
-    archive.close()
-    
-    return classifier
+    return count_load(load_sklearn(), 'sklearn')
+
+# the same forest packed into flat arrays, much faster than sklearn for a single case.
+# model.forest is memory mapped and shared between processes, when it is missing
+# or stale the forest is compiled from model.zip and model.forest written again
+@st.cache(show_spinner=False, allow_output_mutation=True)
+def load_engine():
+    return timed_load(load_forest, 'model.forest', 'model.zip')
+
+# st.cache has no lock of its own, so a Predict click while warm_up() is still
+# loading would load the model a second time. Wait for that load instead
+def get_engine():
+    warm_up().join()
+    return count_load(load_engine(), 'engine')
 
 def prediction(issue, case_origin, case_source, cert_reason,law_type,natural_court,admin_action):   
    
-    classifier = get_classifier()	
-    prediction = classifier.predict( 
-        [[issue, case_origin, case_source, cert_reason,law_type,natural_court,admin_action]])  
+    with profile_request('prediction'):
+        with METRICS.time(STAGE_SECONDS, stage='model', source='app'):
+            engine = get_engine()	
+        with METRICS.time(STAGE_SECONDS, stage='validate', source='app'):
+            row = np.array([[issue, case_origin, case_source, cert_reason,law_type,natural_court,admin_action]], dtype=np.float32)
+        with METRICS.time(STAGE_SECONDS, stage='predict', source='app'):
+            prediction = engine.predict(row)  
+    METRICS.inc(PREDICTIONS, source='app')
     return prediction 
+
+# probabilities over the whole range of one or two inputs, cached per base case
+# so changing what is shown does not score the sweep again. The engine is the
+# cached one, it is told apart by identity rather than hashing its arrays
+@st.cache(show_spinner=False, hash_funcs={CompiledForest: id})
+def get_sweep(engine, base, swept):
+    values = [sweep_values(name) for name in swept]
+    return values, sweep_proba(engine, base, swept, values)
+
+def run_sweep(base):
+    st.subheader('What If')
+    st.markdown('Pick one or two inputs to see the predicted direction over their whole range, keeping the other inputs as entered above.')
+    swept = st.multiselect('Inputs to sweep', FEATURES, format_func=lambda x: FEATURE_LABELS[x])
+    if len(swept) > 2:
+        st.warning('Pick at most two inputs')
+        return
+    if not swept:
+        return
+    points = int(np.prod([len(sweep_values(name)) for name in swept]))
+    if points > MAX_SWEEP_POINTS:
+        st.warning('{} have {:,} combinations together, more than the {:,} a sweep supports. Pick a single input.'.format(
+            ' and '.join(FEATURE_LABELS[name] for name in swept), points, MAX_SWEEP_POINTS))
+        return
+
+    engine = get_engine()
+    values, proba = get_sweep(engine, base, tuple(swept))
+    direction = st.radio('Show probability of', ['conservative', 'liberal'])
+    classes = list(engine.classes_)
+    probability = proba[..., classes.index(1 if direction == 'conservative' else 2)]
+
+    # zooming only slices the cached result
+    masks = []
+    for name, v in zip(swept, values):
+        low, high = st.slider(FEATURE_LABELS[name] + ' range', int(v[0]), int(v[-1]), (int(v[0]), int(v[-1])))
+        masks.append((v >= low) & (v <= high))
+
+    shown, probability = coarsen([v[mask] for v, mask in zip(values, masks)], probability[np.ix_(*masks)],
+                                 MAX_LINE_POINTS if len(swept) == 1 else MAX_HEATMAP_SIDE)
+    if any(len(s) < mask.sum() for s, mask in zip(shown, masks)):
+        st.markdown('Neighbouring values are averaged to fit the chart, narrow the ranges to see every value.')
+
+    if len(swept) == 1:
+        st.line_chart(pd.DataFrame({'P({})'.format(direction): probability},
+                                   index=pd.Index(shown[0], name=FEATURE_LABELS[swept[0]])))
+    else:
+        rows, columns = np.meshgrid(shown[0], shown[1], indexing='ij')
+        frame = pd.DataFrame({swept[0]: rows.ravel(), swept[1]: columns.ravel(), 'probability': probability.ravel()})
+        chart = alt.Chart(frame).mark_rect().encode(
+            x=alt.X(swept[1] + ':O', title=FEATURE_LABELS[swept[1]], axis=alt.Axis(labelOverlap=True)),
+            y=alt.Y(swept[0] + ':O', title=FEATURE_LABELS[swept[0]], axis=alt.Axis(labelOverlap=True)),
+            color=alt.Color('probability:Q', title='P({})'.format(direction), scale=alt.Scale(domain=[0, 1], scheme='redblue')),
+            tooltip=[swept[0], swept[1], 'probability'])
+        st.altair_chart(chart, use_container_width=True)
  
 def run_prediction():
     # the following lines create text boxes in which the user can enter  
@@ -50,29 +156,80 @@ def run_prediction():
        else:
       	    result = 'liberal'		
 		
-       st.info('US supreme court direction will be {}'.format(result)) 
+       with METRICS.time(STAGE_SECONDS, stage='render', source='app'):
+           st.info('US supreme court direction will be {}'.format(result)) 
+
+    run_sweep((issue, case_origin, case_source, cert_reason, law_type, natural_court, admin_action))
+
+def run_batch_prediction():
+    st.markdown('Upload a CSV file with the columns: ' + ', '.join(FEATURES) + '. Every row is scored and a CSV with the predicted direction and its probability is returned. '
+                'The page keeps the upload and the results in memory, score large files with `python batch_predict.py cases.csv predictions.csv` instead.')
+    uploaded_file = st.file_uploader('Cases CSV', type=['csv'])
+    if uploaded_file is not None and st.button('Predict All'):
+        classifier = get_classifier()
+        status = st.empty()
+        def on_chunk(rows, seconds):
+            status.text('{} rows scored ({:.0f} rows/sec)'.format(rows, rows / seconds if seconds > 0 else 0))
+        # results are scored chunk by chunk into a temporary file. The upload
+        # is already in memory and download_button reads the file into memory
+        # once more, so the page holds the output once (only the batch_predict
+        # command line keeps memory flat), but not again as a base64 link
+        with tempfile.TemporaryFile('w+', newline='') as output_file:
+            try:
+                stats = score_csv(classifier, uploaded_file, output_file, on_chunk=on_chunk)
+            except pd.errors.EmptyDataError:
+                st.error('The uploaded file is empty')
+                return
+            except ValueError as error:
+                st.error('Could not read the uploaded file: {}'.format(error))
+                return
+            st.success('Scored {rows} rows ({invalid} invalid) in {seconds:.2f}s, {rows_per_sec:.0f} rows/sec'.format(**stats))
+            output_file.seek(0)
+            st.dataframe(pd.read_csv(output_file, nrows=100))
+            output_file.seek(0)
+            st.download_button('Download predictions', output_file, file_name='predictions.csv', mime='text/csv')
 
 
-# Download a single file and make its content available as a string.
+# Read a single file of the app, from github only when it is not available locally.
 @st.cache(show_spinner=False)
 def get_file_content_as_string(path):
-    url = 'https://raw.githubusercontent.com/Miriam2040/PredictSupremeCourtDecision/master/' + path
-    response = urllib.request.urlopen(url)
-    return response.read().decode("utf-8")
+    return read_source(path)
+
+# images are scaled to display size and encoded once, the cache is kept on disk
+# so a restarted server does not render them again. The modification time is
+# part of the key, an edited image is rendered again
+@st.cache(show_spinner=False, persist=True)
+def get_rendered_image(path, format, modified):
+    return render_image(path, format=format)
+
+def get_image(path, format='PNG'):
+    return get_rendered_image(path, format, os.path.getmtime(path))
+
+# one copy of the demo video for the whole server instead of one per page visit
+@st.cache(show_spinner=False, allow_output_mutation=True)
+def get_video(path):
+    return read_bytes(path)
+
+# start loading the model in the background on the first run of the script,
+# so the first Predict click does not wait for it
+@st.cache(show_spinner=False, allow_output_mutation=True)
+def warm_up():
+    thread = threading.Thread(target=load_engine, daemon=True)
+    thread.start()
+    return thread
 	
 # this is the main function in which we define our webpage  
 def main(): 
-    image = Image.open('Court.jpg')
-    st.image(image, use_column_width=True)
+    warm_up()
+    st.image(get_image('Court.jpg', 'JPEG'), use_column_width=True)
     st.sidebar.title("Navigation")
     app_mode = st.sidebar.radio("Go to",
-        ["Show Instructions", "Run Prediction","Technical Overview","Moral Issues", "App Source Code","Model Source Code","About"])
+        ["Show Instructions", "Run Prediction","Batch Prediction","Technical Overview","Moral Issues", "App Source Code","Model Source Code","About"])
     if app_mode == "App Source Code":
         st.code(get_file_content_as_string("App.py"))
     elif app_mode == "Technical Overview":
-        image = Image.open('tech_review.png')
         st.markdown("<h2 style='text-align: right;'>תיאור טכני</h2>", unsafe_allow_html=True)
-        st.image(image, use_column_width=True)
+        st.image(get_image('tech_review.png'), use_column_width=True)
         st.markdown("<h4 style='text-align: right;'>השתמשנו בדאטה שנמצא באתר בית המשפט העליון בארצות הברית מכיון שאילו נתונים פתוחים ומותרים לשימוש. הדאטה מכיל רשומות של משפטים שהתקיימו ותיוג כיוון המשפט - ליברלי מול שמרני </h4>", unsafe_allow_html=True)
         st.markdown("<h4 style='text-align: right;'>תחילה, עברנו על הדאטה וסיננו את הפיצ'רים היכולים להשפיע על הטיה כדוגמת שם השופט, כתובות וכו'.כך שכל הפ'יצרים שנשארו אינם מצביעים על אוכלוסיה מסוימת ולכן לא יכולה להיות הטיה במודל. לאחר מכן, בחרנו פיצ'רים רלוונטים באמצעות שיטת פיצ'ר סלקשן</h4>", unsafe_allow_html=True)
         st.markdown("<h4 style='text-align: right;'>חילקנו את הדאטה לאימון וטסט כך שסט האימון הכיל כ33% מסך הדאטה שלנו </h4>", unsafe_allow_html=True)
@@ -86,7 +243,7 @@ def main():
         st.markdown("<h3 style='text-align: right;'>תוצאות</h3>", unsafe_allow_html=True)
         st.markdown("<h4 style='text-align: right;'>אחרי שאימנו את המודל של סט האימון בדקנו את ביצועיו באמצעות הטסט סט. עבור הטסט סט קיבלנו דיוק של 78% שזה משמעותית יותר טוב מניחוש רגיל של 50% דיוק</h4>", unsafe_allow_html=True)
         st.markdown("<h4 style='text-align: right;'>כמו כן, בדקנו מהי חשיבות הפיצ'רים בהשפעה על תוצאות המודל</h4>", unsafe_allow_html=True)
-        st.image("FeaturesImportance.PNG") 
+        st.image(get_image('FeaturesImportance.PNG')) 
     elif app_mode == "Moral Issues":
         st.markdown("<h2 style='text-align: right;'>אצלנו הזכויות שלך מוגנות</h2>", unsafe_allow_html=True)
         st.markdown("<h4 style='text-align: right;'>המערכת שלנו, המבוססת על בינה מלאכותית היא ייחודית בנוף שכן היא תוצר של שילוב בין שני עולמות תוכן מרתקים, מדעי המחשב ומשפטים. כך, יחד יצרנו עבורכם את המערכת האיכותית והמדויקת ביותר וזאת ללא פשרות על הזכויות שלכם. המערכת תעזור לאוכלוסיית עורכי הדין לחזות את גישתו של בית המשפט העליון בארצות הברית, ליברלי או שמרני, זאת על ידי הכנסת מספר פרמטרים למערכת. לאחר מספר רגעים תוכלו לדעת בדיוק כיצד עליכם לעבוד על כתב התביעה או כתב ההגנה שלכם ואיזה טענות ייקחו את הלקוח שלכם אל עבר הניצחון</h4>", unsafe_allow_html=True)
@@ -177,10 +334,11 @@ def main():
         st.write("Model training source code is here: [link](https://github.com/Miriam2040/PredictSupremeCourtDecision/blob/main/Supreme_Court_Direction_Prediction.ipynb)")	
     elif app_mode == "Run Prediction":
         run_prediction()
+    elif app_mode == "Batch Prediction":
+        run_batch_prediction()
     elif app_mode == "About":
-        image = Image.open('Team.PNG')
         st.markdown("<h2 style='text-align: right;'> הצוות</h2>", unsafe_allow_html=True)
-        st.image(image, use_column_width=True)
+        st.image(get_image('Team.PNG'), use_column_width=True)
         st.markdown("<h2 style='text-align: right;'> הפרויקט</h2>", unsafe_allow_html=True)
         st.markdown("<h4 style='text-align: right;'>פרויקט זה בוצע במסגרת הקורס בינה מלאכותית ומוסר. רצינו לנצל את העובדה שהצוות מורכב ממומחי תוכן בעולם הבינה המלאכותית וכן מעולם המשפטים. לצורך כך לקחנו בעיה של חיזוי כיוון בית המשפט העליון בארה'ב ובנינו מודל בינה מלאכותית שיחזה זאת. האתר הזה מסביר את העבודה שנעשתה ומנגיש את המודל לשימוש</h4>", unsafe_allow_html=True)
         st.markdown("<h2 style='text-align: right;'> על מקומה של הבינה המלאכותית בארצות הברית</h2>", unsafe_allow_html=True)
@@ -195,10 +353,10 @@ def main():
     elif app_mode == "Show Instructions":
         st.header("The application includes following parts:")
         st.subheader('Run Prediction:')
-        st.markdown('You insert your case parameters and get model prediction for supreme court direction. Here is video demo:')
-        video_file = open('RunPredictionDemo.mp4', 'rb')
-        video_bytes = video_file.read()
-        st.video(video_bytes)
+        st.markdown('You insert your case parameters and get model prediction for supreme court direction. Under What If you can see how the prediction changes over the whole range of one or two of the parameters. Here is video demo:')
+        st.video(get_video('RunPredictionDemo.mp4'))
+        st.subheader('Batch Prediction:')
+        st.markdown('Upload a CSV of cases and download the predicted direction for every row. The same scoring is available from the command line: python batch_predict.py cases.csv predictions.csv')
         st.subheader('Technical Overview:')
         st.markdown('Explanation about technical aspects and work done during ML model creation')
         st.subheader('Moral Issues:')
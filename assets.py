@@ -0,0 +1,47 @@
+import io
+import urllib.request
+
+from PIL import Image
+
+# about twice the width of the main column, still sharp on high dpi screens
+DISPLAY_WIDTH = 1400
+SOURCE_URL = 'https://raw.githubusercontent.com/Miriam2040/PredictSupremeCourtDecision/master/'
+
+
+# Decode an image once, scale it down to the width it is shown at and encode
+# it again. The returned bytes go to st.image as they are, so reruns neither
+# decode the original nor encode it again.
+def render_image(path, width=DISPLAY_WIDTH, format='PNG'):
+    image = Image.open(path)
+    if image.width > width:
+        image = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+
+    options = {'optimize': True}
+    if format == 'JPEG':
+        if image.mode != 'RGB':
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A') if 'A' in image.getbands() else None)
+            image = background
+        options['quality'] = 85
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **options)
+    return buffer.getvalue()
+
+
+def read_bytes(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+# source files come from the local tree, the repository on github is only
+# asked when the file is not there and a fallback url is given
+def read_source(path, fallback_url=SOURCE_URL, timeout=5):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        if fallback_url is None:
+            raise
+    response = urllib.request.urlopen(fallback_url + path, timeout=timeout)
+    return response.read().decode('utf-8')
@@ -0,0 +1,105 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from metrics import BATCH_BUCKETS, BATCH_SIZE, METRICS, PREDICTIONS, STAGE_SECONDS
+from model_loader import DIRECTIONS, FEATURES, FEATURE_RANGES, load_classifier
+
+DEFAULT_CHUNKSIZE = 50000
+
+_LOW = np.array([FEATURE_RANGES[name][0] for name in FEATURES], dtype=np.float64)
+_HIGH = np.array([FEATURE_RANGES[name][1] for name in FEATURES], dtype=np.float64)
+
+
+# turn a chunk of raw csv columns into a float32 feature matrix plus a mask of
+# the rows that are usable: every value numeric, integral and in range
+def coerce_features(frame):
+    missing = [name for name in FEATURES if name not in frame.columns]
+    if missing:
+        raise ValueError('missing columns: {}'.format(', '.join(missing)))
+
+    values = np.empty((len(frame), len(FEATURES)), dtype=np.float64)
+    for i, name in enumerate(FEATURES):
+        values[:, i] = pd.to_numeric(frame[name], errors='coerce').to_numpy(np.float64, na_value=np.nan)
+
+    with np.errstate(invalid='ignore'):
+        valid = np.isfinite(values) & (values == np.floor(values)) & (values >= _LOW) & (values <= _HIGH)
+    valid = valid.all(axis=1)
+    values[~valid] = 0
+
+    return values.astype(np.float32), valid
+
+
+# one predict_proba call for the whole chunk, invalid rows are reported
+# instead of dropped so the output stays aligned with the input
+def score_chunk(classifier, frame):
+    with METRICS.time(STAGE_SECONDS, stage='validate', source='batch'):
+        features, valid = coerce_features(frame)
+    direction = np.full(len(frame), 'invalid', dtype=object)
+    probability = np.full(len(frame), np.nan)
+
+    if valid.any():
+        with METRICS.time(STAGE_SECONDS, stage='predict', source='batch'):
+            proba = classifier.predict_proba(pd.DataFrame(features[valid], columns=FEATURES))
+        METRICS.observe(BATCH_SIZE, int(valid.sum()), buckets=BATCH_BUCKETS, source='batch')
+        METRICS.inc(PREDICTIONS, int(valid.sum()), source='batch')
+        best = proba.argmax(axis=1)
+        classes = np.asarray(classifier.classes_)
+        direction[valid] = [DIRECTIONS.get(int(c), str(c)) for c in classes[best]]
+        probability[valid] = proba[np.arange(len(best)), best]
+
+    scored = frame[FEATURES].copy()
+    scored['direction'] = direction
+    scored['probability'] = probability
+    return scored
+
+
+def iter_scored_chunks(classifier, source, chunksize=DEFAULT_CHUNKSIZE):
+    reader = pd.read_csv(source, usecols=lambda name: name in FEATURES, dtype=str, chunksize=chunksize)
+    for frame in reader:
+        yield score_chunk(classifier, frame)
+
+
+# stream source csv to destination csv chunk by chunk, memory is bounded by
+# the chunk size and not by the size of the file
+def score_csv(classifier, source, destination, chunksize=DEFAULT_CHUNKSIZE, on_chunk=None):
+    rows = 0
+    invalid = 0
+    start = time.perf_counter()
+    for i, scored in enumerate(iter_scored_chunks(classifier, source, chunksize)):
+        scored.to_csv(destination, header=(i == 0), index=False, float_format='%.4f')
+        rows += len(scored)
+        invalid += int((scored['direction'] == 'invalid').sum())
+        if on_chunk is not None:
+            on_chunk(rows, time.perf_counter() - start)
+    seconds = time.perf_counter() - start
+
+    return {'rows': rows, 'invalid': invalid, 'seconds': seconds,
+            'rows_per_sec': rows / seconds if seconds > 0 else 0.0}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Score a csv of cases with the supreme court direction model')
+    parser.add_argument('input', help='csv with columns ' + ', '.join(FEATURES) + " ('-' for stdin)")
+    parser.add_argument('output', help="csv to write, '-' for stdout")
+    parser.add_argument('--model', default='model.zip')
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    args = parser.parse_args(argv)
+
+    classifier = load_classifier(args.model)
+    source = sys.stdin if args.input == '-' else args.input
+    if args.output == '-':
+        stats = score_csv(classifier, source, sys.stdout, args.chunksize)
+    else:
+        with open(args.output, 'w', newline='') as destination:
+            stats = score_csv(classifier, source, destination, args.chunksize)
+
+    print('scored {rows} rows ({invalid} invalid) in {seconds:.2f}s, {rows_per_sec:.0f} rows/sec'.format(**stats),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
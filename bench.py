@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+from model_artifact import read_artifact
+from model_loader import FEATURES, load_classifier, sample_rows
+from sweep import sweep_proba
+
+BATCH_SIZES = (10, 100, 1000, 10000)
+# lower is better for every result except these
+HIGHER_IS_BETTER = ('rows_per_sec',)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {'commit': git_commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+            'numpy': np.__version__, 'sklearn': sklearn.__version__, 'platform': platform.platform(),
+            'cpus': os.cpu_count()}
+
+
+# load time and resident memory, each loader in a fresh process
+def model_load(model, artifact, repeat):
+    results = {}
+    for method in ('legacy', 'mmap'):
+        runs = []
+        for _ in range(repeat):
+            output = subprocess.run([sys.executable, 'bench_model_load.py', '--child', method, '--model', model,
+                                     '--artifact', artifact], check=True, capture_output=True, text=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        results[method] = {'load_seconds': min(run['load_seconds'] for run in runs),
+                           'rss_mb': min(run['rss_kb'] for run in runs) / 1024}
+    return results
+
+
+def latencies_ms(function, rows, calls):
+    times = []
+    for row in rows[:calls]:
+        start = time.perf_counter()
+        function(row)
+        times.append((time.perf_counter() - start) * 1000)
+    return {'p50_ms': float(np.percentile(times, 50)), 'p99_ms': float(np.percentile(times, 99))}
+
+
+def single_row(models, calls):
+    rows = sample_rows(calls, seed=1)
+    return {name: latencies_ms(predict, [row[None, :] for row in rows], calls) for name, predict in models.items()}
+
+
+def batch_throughput(models, sizes, repeat):
+    results = {}
+    for name, predict in models.items():
+        results[name] = {}
+        for size in sizes:
+            rows = sample_rows(size, seed=2)
+            best = min(_timed(predict, rows) for _ in range(repeat))
+            results[name][str(size)] = {'seconds': best, 'rows_per_sec': size / best}
+    return results
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def sweep(forest, repeat):
+    base = sample_rows(1, seed=3)[0]
+    return {'lawType x naturalCourt': {'seconds': min(_timed(sweep_proba, forest, base, ['lawType', 'naturalCourt'])
+                                                      for _ in range(repeat))}}
+
+
+def flatten(results, prefix=''):
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + key + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+# ratio of every number against a saved run, slower results are flagged
+def compare(results, baseline, tolerance):
+    new, old = flatten(results['results']), flatten(baseline['results'])
+    print('{:<55} {:>12} {:>12} {:>8}'.format('result', 'baseline', 'current', 'ratio'))
+    regressions = 0
+    for key in sorted(set(new) & set(old)):
+        ratio = new[key] / old[key] if old[key] else float('inf')
+        worse = ratio < 1 / tolerance if key.endswith(HIGHER_IS_BETTER) else ratio > tolerance
+        regressions += worse
+        print('{:<55} {:>12.4g} {:>12.4g} {:>8.2f}{}'.format(key, old[key], new[key], ratio, '  <- regression' if worse else ''))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark model load, latency, throughput and memory, saved as json')
+    parser.add_argument('--model', default='model.zip')
+    parser.add_argument('--artifact', default='model.forest')
+    parser.add_argument('--output', help='json file to write, default bench_results/<commit>.json')
+    parser.add_argument('--compare', help='earlier json result to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='ratio above which a result counts as a regression')
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.artifact):
+        subprocess.run([sys.executable, 'model_artifact.py', args.model, args.artifact], check=True)
+    classifier = load_classifier(args.model)
+    forest = read_artifact(args.artifact)
+    models = {'sklearn': lambda rows: classifier.predict_proba(pd.DataFrame(rows, columns=FEATURES)),
+              'engine': forest.predict_proba}
+
+    results = {'environment': environment(), 'results': {
+        'model_load': model_load(args.model, args.artifact, args.repeat),
+        'single_row': single_row(models, args.calls),
+        'batch': batch_throughput(models, BATCH_SIZES, args.repeat),
+        'sweep': sweep(forest, args.repeat),
+    }}
+
+    output = args.output or os.path.join('bench_results', '{}.json'.format(results['environment']['commit'] or 'local'))
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('wrote ' + output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            sys.exit(1)
+    else:
+        for key, value in sorted(flatten(results['results']).items()):
+            print('{:<55} {:>12.4g}'.format(key, value))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+# the first App.py only imports urllib and relies on the server having loaded urllib.request
+import urllib.request  # noqa: F401
+
+# Times the app script itself, run without a streamlit server (widgets keep
+# their defaults, so main() draws the default page). Every line is a fresh
+# process, so the in-memory caches start empty like a new server:
+#
+#   import          loading the script and everything it imports
+#   first run       main(), the first time a visitor opens the app
+#   rerun           main() again, every widget change reruns the script
+#   source page     what the App Source Code page reads
+#   predict click   the first prediction(), --think seconds after the first run
+#
+# "before" is App.py at --before, written next to App.py so it finds the same
+# model and assets. "after, cold" clears the persisted st.cache directory
+# first, "after, restart" keeps what the previous process persisted.
+COLUMNS = ('import', 'first_run', 'rerun', 'source_page', 'predict_click')
+CASE = (80180, 1, 1, 1, 1, 1301, 0)
+BEFORE_SCRIPT = 'App_before.py'
+
+
+def timed(results, name, function, *args):
+    start = time.perf_counter()
+    try:
+        function(*args)
+    except Exception as error:
+        results['errors'].append('{}: {!r}'.format(name, error))
+    results[name] = (time.perf_counter() - start) * 1000
+
+
+def measure(script, think):
+    results = {'errors': []}
+    spec = importlib.util.spec_from_file_location('app', script)
+    app = sys.modules['app'] = importlib.util.module_from_spec(spec)
+    timed(results, 'import', spec.loader.exec_module, app)
+    timed(results, 'first_run', app.main)
+    timed(results, 'rerun', app.main)
+    timed(results, 'source_page', app.get_file_content_as_string, 'App.py')
+    time.sleep(think)
+    timed(results, 'predict_click', app.prediction, *CASE)
+    return results
+
+
+def child(script, think):
+    output = subprocess.run([sys.executable, __file__, '--child', script, '--think', str(think)], check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time first render, reruns and the first prediction of the app, '
+                                                 'before and after pre-rendering, caching and warm up')
+    parser.add_argument('--before', help='git revision of the App.py to compare against, default the first commit')
+    parser.add_argument('--think', type=float, default=3,
+                        help='seconds between the first run and the prediction on the last line')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.think)))
+        return
+
+    from streamlit.file_util import get_streamlit_file_path
+
+    before = args.before or subprocess.run(['git', 'rev-list', '--max-parents=0', 'HEAD'], check=True,
+                                           capture_output=True, text=True).stdout.split()[0]
+    with open(BEFORE_SCRIPT, 'w') as f:
+        f.write(subprocess.run(['git', 'show', before + ':App.py'], check=True, capture_output=True, text=True).stdout)
+    try:
+        rows = [('before ' + before[:8], child(BEFORE_SCRIPT, 0))]
+    finally:
+        os.remove(BEFORE_SCRIPT)
+
+    shutil.rmtree(get_streamlit_file_path('cache'), ignore_errors=True)
+    rows.append(('after, cold', child('App.py', 0)))
+    rows.append(('after, restart', child('App.py', 0)))
+    rows.append(('after, restart, {:g}s think'.format(args.think), child('App.py', args.think)))
+
+    print('{:<28}'.format('milliseconds') + ''.join('{:>15}'.format(name.replace('_', ' ')) for name in COLUMNS))
+    for name, results in rows:
+        print('{:<28}'.format(name) + ''.join('{:>15.1f}'.format(results[column]) for column in COLUMNS))
+    for name, results in rows:
+        for error in results['errors']:
+            print('{}, {}'.format(name, error))
+
+
+if __name__ == '__main__':
+    main()
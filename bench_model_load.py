@@ -0,0 +1,79 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from model_loader import sample_rows
+
+
+# resident memory of this process in KB, split into anonymous (private) and
+# file backed pages; file backed pages of a memmap are shared with the page cache
+def memory_kb():
+    usage = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            if name in ('VmRSS', 'RssAnon', 'RssFile'):
+                usage[name] = int(value.split()[0])
+    return usage
+
+
+# runs in a fresh interpreter so each loader starts from the same state
+def measure(method, model, artifact):
+    before = memory_kb()
+    start = time.perf_counter()
+    if method == 'legacy':
+        from model_loader import load_classifier
+        model_object = load_classifier(model)
+    elif method == 'compiled':
+        from forest_engine import compile_forest
+        from model_loader import load_classifier
+        model_object = compile_forest(load_classifier(model))
+    else:
+        from model_artifact import read_artifact
+        model_object = read_artifact(artifact, verify=(method == 'mmap'))
+    load_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model_object.predict_proba(sample_rows(1000))
+    first_predict_seconds = time.perf_counter() - start
+    after = memory_kb()
+
+    return {'method': method, 'load_seconds': load_seconds, 'first_predict_seconds': first_predict_seconds,
+            'rss_kb': after['VmRSS'] - before['VmRSS'],
+            'anon_kb': after['RssAnon'] - before['RssAnon'],
+            'file_kb': after['RssFile'] - before['RssFile']}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare model load time and memory of the zip/pickle and memory mapped artifacts')
+    parser.add_argument('--model', default='model.zip')
+    parser.add_argument('--artifact', default='model.forest')
+    parser.add_argument('--methods', nargs='+', default=['legacy', 'compiled', 'mmap', 'mmap-noverify'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.model, args.artifact)))
+        return
+
+    if not os.path.exists(args.artifact):
+        subprocess.run([sys.executable, 'model_artifact.py', args.model, args.artifact], check=True)
+
+    print('{:<14} {:>10} {:>14} {:>10} {:>10} {:>10}'.format('method', 'load s', 'first pred s', 'rss MB', 'anon MB', 'file MB'))
+    for method in args.methods:
+        runs = []
+        for _ in range(args.repeat):
+            output = subprocess.run([sys.executable, __file__, '--child', method, '--model', args.model,
+                                     '--artifact', args.artifact], check=True, capture_output=True, text=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        best = min(runs, key=lambda run: run['load_seconds'])
+        print('{method:<14} {load_seconds:>10.3f} {first_predict_seconds:>14.3f} {rss:>10.1f} {anon:>10.1f} {file:>10.1f}'.format(
+            rss=best['rss_kb'] / 1024, anon=best['anon_kb'] / 1024, file=best['file_kb'] / 1024, **best))
+
+
+if __name__ == '__main__':
+    main()
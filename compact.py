@@ -0,0 +1,206 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score, roc_auc_score
+
+from forest_engine import CompiledForest
+from model_artifact import ARRAYS, load_forest, write_artifact
+from train import DEFAULT_SOURCE, collapse, group_split, load_features
+
+CURVE_TREES = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+
+# probability of classes_[1] from every single tree, shape (n_trees, n_rows)
+def tree_probabilities(forest, x):
+    return forest.value[forest.apply(x)][:, :, 1]
+
+
+# Forward selection: every step adds the tree that lowers the weighted Brier
+# score of the averaged forest the most on the validation rows. Accuracy alone
+# ties too often to rank single trees. Trees after n_select keep their order.
+def greedy_order(probabilities, target, weights, n_select):
+    n_trees = probabilities.shape[0]
+    total = np.zeros(probabilities.shape[1])
+    remaining = np.ones(n_trees, dtype=bool)
+    order = []
+    for k in range(1, min(n_select, n_trees) + 1):
+        candidates = np.flatnonzero(remaining)
+        errors = (((total + probabilities[candidates]) / k - target) ** 2) @ weights
+        best = candidates[errors.argmin()]
+        order.append(best)
+        remaining[best] = False
+        total += probabilities[best]
+    return np.concatenate([np.array(order, dtype=np.int64), np.flatnonzero(remaining)])
+
+
+# The inputs are integer codes, so x <= t and x <= floor(t) + 0.5 agree for
+# every input and thresholds fit float32 exactly. Leaf probabilities are
+# rounded to multiples of 1 / levels, which also makes more leaves identical
+# for merge_subtrees.
+def quantize(forest, levels=256):
+    threshold = np.where(np.isinf(forest.threshold), np.inf, np.floor(forest.threshold) + 0.5).astype(np.float32)
+    value = (np.round(np.asarray(forest.value) * levels) / levels).astype(np.float32)
+    return CompiledForest(forest.feature, threshold, forest.children, value, forest.roots,
+                          forest.max_depth, forest.classes_, forest.n_features_in_)
+
+
+# Hash consing of the node table: identical leaves and identical subtrees,
+# within a tree or across trees, are stored once. Children always come after
+# their parent in the table, so walking it backwards sees children first.
+def merge_subtrees(forest):
+    feature = np.asarray(forest.feature)
+    threshold = np.asarray(forest.threshold)
+    children = np.asarray(forest.children).reshape(-1, 2)
+    value = np.asarray(forest.value)
+
+    canonical = np.empty(forest.n_nodes, dtype=np.int64)
+    table = {}
+    kept = []
+    for node in range(forest.n_nodes - 1, -1, -1):
+        left, right = children[node]
+        if left == node:
+            key = (value[node].tobytes(),)
+        else:
+            key = (feature[node], threshold[node].item(), canonical[left], canonical[right])
+        if key not in table:
+            table[key] = len(kept)
+            kept.append(node)
+        canonical[node] = table[key]
+
+    # number the kept nodes so parents come first again
+    kept = np.array(kept[::-1], dtype=np.int64)
+    n_kept = len(kept)
+    renumber = n_kept - 1 - canonical
+    merged_children = renumber[children[kept]]
+    leaf = children[kept, 0] == kept
+    merged_children[leaf] = np.arange(n_kept)[leaf, None]
+
+    return CompiledForest(feature[kept], threshold[kept], merged_children.astype(np.int32).ravel(), value[kept],
+                          renumber[forest.roots].astype(np.int32), forest.max_depth, forest.classes_,
+                          forest.n_features_in_)
+
+
+def size_mb(forest):
+    return sum(np.asarray(getattr(forest, name)).nbytes for name in ARRAYS) / (1 << 20)
+
+
+# best of `repeat` single row predict_proba calls, in milliseconds
+def latency_ms(forest, x, repeat=200):
+    row = np.asarray(x[:1])
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        forest.predict_proba(row)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def weighted_scores(forest, x, y, weights):
+    proba = forest.predict_proba(x)
+    return {'accuracy': accuracy_score(y, forest.classes_[proba.argmax(axis=1)], sample_weight=weights),
+            'roc_auc': roc_auc_score(y, proba[:, 1], sample_weight=weights)}
+
+
+def build(forest, order, n_trees, merge=True, quantized=True):
+    compacted = forest.select(order[:n_trees])
+    if quantized:
+        compacted = quantize(compacted)
+    if merge:
+        compacted = merge_subtrees(compacted)
+    return compacted
+
+
+# largest number of trees whose compacted forest still satisfies fits()
+def largest_fitting(fits, n_trees):
+    low, high = 1, n_trees
+    if not fits(low):
+        return low
+    while low < high:
+        middle = (low + high + 1) // 2
+        if fits(middle):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def tradeoff_curve(forest, order, validation, test, merge, quantized):
+    rows = []
+    points = sorted(set(k for k in CURVE_TREES if k < forest.n_trees) | {forest.n_trees})
+    for k in points:
+        compacted = build(forest, order, k, merge, quantized)
+        labels, evaluated = compacted.predict_early_exit(test[0])
+        rows.append(dict({'trees': k, 'nodes': compacted.n_nodes, 'size_mb': size_mb(compacted),
+                          'val_accuracy': weighted_scores(compacted, *validation)['accuracy']},
+                         **{'test_' + name: score for name, score in weighted_scores(compacted, *test).items()},
+                         latency_ms=latency_ms(compacted, test[0]),
+                         early_exit_trees=np.average(evaluated, weights=test[2])))
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Shrink the forest to a latency or size budget')
+    parser.add_argument('source', nargs='?', default=DEFAULT_SOURCE, help='SCDB csv the model was trained on')
+    parser.add_argument('--artifact', default='model.forest')
+    parser.add_argument('--model', default='model.zip')
+    parser.add_argument('--output', default='model.compact.forest')
+    parser.add_argument('--report', help='write the trade-off curve to this csv')
+    budget = parser.add_mutually_exclusive_group(required=True)
+    budget.add_argument('--trees', type=int)
+    budget.add_argument('--latency-ms', type=float, help='single case predict_proba budget')
+    budget.add_argument('--size-mb', type=float)
+    parser.add_argument('--max-accuracy-loss', type=float, default=0.01,
+                        help='largest validation accuracy drop accepted against the full forest')
+    parser.add_argument('--greedy-trees', type=int, default=500, help='trees ranked by forward selection')
+    parser.add_argument('--no-merge', action='store_true')
+    parser.add_argument('--no-quantize', action='store_true')
+    args = parser.parse_args(argv)
+    merge, quantized = not args.no_merge, not args.no_quantize
+
+    forest = load_forest(args.artifact, args.model)
+
+    # the held out cases of train.py, halved by case: one half ranks the
+    # trees, the other half is only used for the report
+    x, y, groups = load_features(args.source)
+    train_index, held_out = group_split(groups)
+    validation_index, test_index = group_split(groups[held_out], test_size=0.5, random_state=0)
+    validation = collapse(x[held_out[validation_index]], y[held_out[validation_index]])
+    test = collapse(x[held_out[test_index]], y[held_out[test_index]])
+
+    start = time.perf_counter()
+    target = (validation[1] == forest.classes_[1]).astype(np.float64)
+    order = greedy_order(tree_probabilities(forest, validation[0]), target, validation[2], args.greedy_trees)
+    print('ranked {} trees in {:.1f}s'.format(forest.n_trees, time.perf_counter() - start), file=sys.stderr)
+
+    if args.trees:
+        n_trees = min(args.trees, forest.n_trees)
+    elif args.latency_ms:
+        n_trees = largest_fitting(lambda k: latency_ms(build(forest, order, k, merge, quantized), test[0]) <= args.latency_ms,
+                                  forest.n_trees)
+    else:
+        n_trees = largest_fitting(lambda k: size_mb(build(forest, order, k, merge, quantized)) <= args.size_mb,
+                                  forest.n_trees)
+
+    compacted = build(forest, order, n_trees, merge, quantized)
+    write_artifact(compacted, args.output, source=args.model)
+
+    curve = tradeoff_curve(forest, order, validation, test, merge, quantized)
+    print(curve.to_string(index=False, float_format='%.4f'))
+    if args.report:
+        curve.to_csv(args.report, index=False)
+
+    full_accuracy = weighted_scores(forest, *validation)['accuracy']
+    accuracy = weighted_scores(compacted, *validation)['accuracy']
+    print('wrote {} trees, {} nodes, {:.2f} MB to {}; validation accuracy {:.4f} (full forest {:.4f})'.format(
+        n_trees, compacted.n_nodes, size_mb(compacted), args.output, accuracy, full_accuracy))
+    if full_accuracy - accuracy > args.max_accuracy_loss:
+        print('accuracy loss {:.4f} is above --max-accuracy-loss {}'.format(full_accuracy - accuracy,
+                                                                            args.max_accuracy_loss), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
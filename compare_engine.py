@@ -0,0 +1,78 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from forest_engine import compile_forest
+from model_loader import FEATURES, load_classifier
+from train import load_features, split
+
+
+# the notebook's test split, cleaned the same way train.py does it
+def load_test_split(csv_path):
+    x, y, groups = load_features(csv_path)
+    x_train, x_test, y_train, y_test = split(x, y)
+    return pd.DataFrame(x_test, columns=FEATURES), y_test
+
+
+def check_equivalence(classifier, forest, x):
+    expected = classifier.predict_proba(x)
+    actual = forest.predict_proba(x.to_numpy())
+    max_error = float(np.abs(expected - actual).max())
+    mismatches = int((classifier.classes_[expected.argmax(axis=1)] != forest.predict(x.to_numpy())).sum())
+    return max_error, mismatches
+
+
+# best of `repeat` runs, in seconds
+def time_call(function, x, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(x)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def compare_latency(classifier, forest, x, batch_sizes=(1, 100, 100000), seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for size in batch_sizes:
+        batch = x.iloc[rng.integers(0, len(x), size)]
+        array = batch.to_numpy()
+        repeat = 20 if size <= 100 else 3
+        sklearn_seconds = time_call(classifier.predict_proba, batch, repeat)
+        engine_seconds = time_call(forest.predict_proba, array, repeat)
+        rows.append({'batch_size': size,
+                     'distinct_rows': len(np.unique(array, axis=0)),
+                     'sklearn_ms': sklearn_seconds * 1000,
+                     'engine_ms': engine_seconds * 1000,
+                     'speedup': sklearn_seconds / engine_seconds})
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the compiled forest against sklearn and compare latency')
+    parser.add_argument('--model', default='model.zip')
+    parser.add_argument('--data', default='SCDB_2020_01_justiceCentered_Citation.csv')
+    parser.add_argument('--tolerance', type=float, default=1e-9)
+    args = parser.parse_args(argv)
+
+    classifier = load_classifier(args.model)
+    start = time.perf_counter()
+    forest = compile_forest(classifier)
+    print('compiled {} trees, {} nodes in {:.2f}s'.format(forest.n_trees, forest.n_nodes, time.perf_counter() - start))
+
+    x_test, y_test = load_test_split(args.data)
+    max_error, mismatches = check_equivalence(classifier, forest, x_test)
+    print('test split: {} rows, max |proba difference| {:.3g}, {} label mismatches'.format(len(x_test), max_error, mismatches))
+
+    print(compare_latency(classifier, forest, x_test).to_string(index=False, float_format='%.3f'))
+
+    if max_error > args.tolerance or mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
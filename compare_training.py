@@ -0,0 +1,46 @@
+import argparse
+
+import pandas as pd
+
+from train import DEFAULT_SOURCE, StageReport, collapse, evaluate, fit_forest, group_split, load_features, split
+
+
+# fit time, peak memory and held out metrics of the notebook's row level
+# split against grouped splits with and without collapsing justice copies
+def compare(x, y, groups, n_estimators, max_depth, n_jobs, random_state):
+    report = StageReport()
+    x_train, x_test, y_train, y_test = split(x, y)
+    train_index, test_index = group_split(groups)
+    x_collapsed, y_collapsed, weights = collapse(x[train_index], y[train_index])
+
+    setups = [
+        ('notebook row split', x_train, y_train, None, x_test, y_test),
+        ('case split', x[train_index], y[train_index], None, x[test_index], y[test_index]),
+        ('case split, collapsed', x_collapsed, y_collapsed, weights, x[test_index], y[test_index]),
+    ]
+    rows = []
+    for name, fit_x, fit_y, fit_weights, test_x, test_y in setups:
+        with report.stage(name):
+            classifier = fit_forest(fit_x, fit_y, fit_weights, n_estimators, max_depth, n_jobs, random_state)
+        name, seconds, peak = report.stages[-1]
+        rows.append(dict({'setup': name, 'train_rows': len(fit_y), 'fit_seconds': seconds, 'peak_mb': peak},
+                         **evaluate(classifier, test_x, test_y)))
+    return pd.DataFrame(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare training on justice rows against collapsed, case split data')
+    parser.add_argument('source', nargs='?', default=DEFAULT_SOURCE)
+    parser.add_argument('--n-estimators', type=int, default=2000)
+    parser.add_argument('--max-depth', type=int, default=12)
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--random-state', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    x, y, groups = load_features(args.source)
+    result = compare(x, y, groups, args.n_estimators, args.max_depth, args.n_jobs, args.random_state)
+    print(result.to_string(index=False, float_format='%.4f'))
+
+
+if __name__ == '__main__':
+    main()
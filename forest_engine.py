@@ -0,0 +1,162 @@
+import numpy as np
+
+# upper bound on (trees x rows) node indices held in memory at once while
+# walking the forest, larger batches are evaluated in row blocks
+DEFAULT_BLOCK_NODES = 1 << 20
+
+
+# A random forest flattened into packed arrays. All trees share one node
+# table; node i of the forest splits on feature[i] at threshold[i] and moves
+# to children[2 * i] (x <= threshold) or children[2 * i + 1] (x > threshold).
+# Leaves point to themselves with an infinite threshold, so every row can take
+# exactly max_depth steps without checking whether it already reached a leaf.
+class CompiledForest:
+
+    def __init__(self, feature, threshold, children, value, roots, max_depth, classes, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.classes_ = np.asarray(classes)
+        self.n_features_in_ = int(n_features)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    # node reached by every tree for every row, shape (n_trees, n_rows)
+    def apply(self, X):
+        return self._walk(self._check_input(X), self.roots)
+
+    def _walk(self, X, roots):
+        n_rows = X.shape[0]
+        flat = X.ravel()
+        offsets = (np.arange(n_rows, dtype=np.int64) * self.n_features_in_)[None, :]
+
+        nodes = np.repeat(np.asarray(roots)[:, None], n_rows, axis=1)
+        for _ in range(self.max_depth):
+            goes_right = flat[offsets + self.feature[nodes]] > self.threshold[nodes]
+            nodes = self.children[2 * nodes + goes_right]
+        return nodes
+
+    def predict_proba(self, X, block_nodes=DEFAULT_BLOCK_NODES):
+        X = self._check_input(X)
+        # the inputs are small integer codes and batches repeat cases a lot,
+        # so every distinct row is only walked once
+        inverse = None
+        if X.shape[0] > 1:
+            X, inverse = np.unique(X, axis=0, return_inverse=True)
+            X = np.ascontiguousarray(X)
+
+        n_rows = X.shape[0]
+        proba = np.empty((n_rows, self.value.shape[1]))
+        step = max(1, block_nodes // max(1, self.n_trees))
+        for start in range(0, n_rows, step):
+            nodes = self.apply(X[start:start + step])
+            proba[start:start + step] = self.value[nodes].sum(axis=0) / self.n_trees
+
+        if inverse is not None:
+            proba = proba[inverse.ravel()]
+        return proba
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    # Same labels as predict() while walking only the trees a row needs. Trees
+    # are evaluated block by block and a row stops once the lead of its best
+    # class is larger than what the trees left could make up, since one tree
+    # adds at most 1 to any class. Returns the labels and the number of trees
+    # evaluated for every row.
+    def predict_early_exit(self, X, block_trees=16):
+        X = self._check_input(X)
+        n_rows = X.shape[0]
+        totals = np.zeros((n_rows, self.value.shape[1]))
+        evaluated = np.zeros(n_rows, dtype=np.int32)
+        active = np.arange(n_rows)
+        for start in range(0, self.n_trees, block_trees):
+            roots = self.roots[start:start + block_trees]
+            totals[active] += self.value[self._walk(X[active], roots)].sum(axis=0)
+            evaluated[active] += len(roots)
+
+            remaining = self.n_trees - start - len(roots)
+            ranked = np.sort(totals[active], axis=1)
+            lead = ranked[:, -1] - ranked[:, -2] if ranked.shape[1] > 1 else np.inf
+            active = active[lead <= remaining]
+            if len(active) == 0:
+                break
+        return self.classes_[totals.argmax(axis=1)], evaluated
+
+    # a forest with only the given trees, in the given order. Nodes are found
+    # by walking down from the roots, so forests sharing subtrees work as well
+    def select(self, trees):
+        roots = self.roots[np.asarray(trees, dtype=np.int64)]
+        reachable = np.zeros(self.n_nodes, dtype=bool)
+        frontier = np.unique(roots)
+        while len(frontier):
+            reachable[frontier] = True
+            frontier = np.unique(self.children.reshape(-1, 2)[frontier].ravel())
+            frontier = frontier[~reachable[frontier]]
+
+        kept = np.flatnonzero(reachable)
+        renumber = np.full(self.n_nodes, -1, dtype=np.int32)
+        renumber[kept] = np.arange(len(kept), dtype=np.int32)
+        return CompiledForest(
+            feature=self.feature[kept],
+            threshold=self.threshold[kept],
+            children=renumber[self.children.reshape(-1, 2)[kept]].ravel(),
+            value=self.value[kept],
+            roots=renumber[roots],
+            max_depth=self.max_depth,
+            classes=self.classes_,
+            n_features=self.n_features_in_,
+        )
+
+    def _check_input(self, X):
+        # same float32 cast sklearn applies before walking its trees
+        X = np.ascontiguousarray(np.asarray(X, dtype=np.float32))
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError('expected input with {} features, got shape {}'.format(self.n_features_in_, X.shape))
+        return X
+
+
+# export step: pack the trees of a fitted sklearn RandomForestClassifier
+def compile_forest(classifier):
+    features, thresholds, children, values, roots = [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in classifier.estimators_:
+        tree = estimator.tree_
+        n = tree.node_count
+        leaf = tree.children_left == -1
+        own = np.arange(offset, offset + n, dtype=np.int32)
+
+        left = np.where(leaf, own, tree.children_left + offset).astype(np.int32)
+        right = np.where(leaf, own, tree.children_right + offset).astype(np.int32)
+        features.append(np.where(leaf, 0, tree.feature).astype(np.int32))
+        thresholds.append(np.where(leaf, np.inf, tree.threshold))
+        children.append(np.column_stack([left, right]).ravel())
+
+        # per tree class probabilities, as in DecisionTreeClassifier.predict_proba
+        value = tree.value[:, 0, :].astype(np.float64)
+        values.append(value / value.sum(axis=1, keepdims=True))
+
+        roots.append(offset)
+        offset += n
+        max_depth = max(max_depth, tree.max_depth)
+
+    return CompiledForest(
+        feature=np.concatenate(features),
+        threshold=np.concatenate(thresholds),
+        children=np.concatenate(children),
+        value=np.concatenate(values),
+        roots=np.array(roots, dtype=np.int32),
+        max_depth=max_depth,
+        classes=classifier.classes_,
+        n_features=classifier.n_features_in_,
+    )
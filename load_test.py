@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+import json
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from model_loader import FEATURE_RANGES, FEATURES
+
+# service settings compared by default: dynamic micro-batching against one
+# predict_proba call per request
+MODES = {
+    'batched': [],
+    'naive': ['--max-batch', '1', '--max-wait', '0'],
+}
+
+
+def random_cases(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{name: int(rng.integers(FEATURE_RANGES[name][0], FEATURE_RANGES[name][1] + 1)) for name in FEATURES}
+            for _ in range(n)]
+
+
+async def request(reader, writer, host, body):
+    writer.write('POST /predict HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n'.format(
+        host, len(body)).encode('latin-1') + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    await reader.readexactly(length)
+    return status
+
+
+# every client keeps one connection open and sends its share of the cases
+# back to back, latencies are measured per request on the client side
+async def client(host, port, bodies, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    for body in bodies:
+        start = time.perf_counter()
+        status = await request(reader, writer, host, body)
+        latencies.append(time.perf_counter() - start)
+        statuses[status] = statuses.get(status, 0) + 1
+    writer.close()
+
+
+async def run_load(host, port, requests, concurrency, seed=0):
+    bodies = [json.dumps(case).encode('utf-8') for case in random_cases(requests, seed)]
+    latencies, statuses = [], {}
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, bodies[i::concurrency], latencies, statuses) for i in range(concurrency)))
+    seconds = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    return {'requests': requests, 'concurrency': concurrency, 'seconds': seconds,
+            'throughput': requests / seconds,
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'statuses': statuses}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port, process, timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('service exited with code {}'.format(process.returncode))
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1) as s:
+                s.sendall(b'GET /readyz HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n')
+                if s.recv(64).startswith(b'HTTP/1.1 200'):
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError('service was not ready after {}s'.format(timeout))
+
+
+def run_mode(mode, service_args, requests, concurrency):
+    port = free_port()
+    process = subprocess.Popen([sys.executable, 'service.py', '--port', str(port)] + service_args + MODES[mode],
+                               stdout=subprocess.DEVNULL)
+    try:
+        wait_ready(port, process)
+        # a short warm up so both modes are measured with a hot model
+        asyncio.run(run_load('127.0.0.1', port, min(requests, 200), concurrency, seed=1))
+        result = asyncio.run(run_load('127.0.0.1', port, requests, concurrency))
+    finally:
+        process.terminate()
+        process.wait()
+    result['mode'] = mode
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test service.py with and without micro-batching')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--modes', nargs='+', choices=sorted(MODES), default=['naive', 'batched'])
+    parser.add_argument('--host', help='test an already running service instead of starting one')
+    parser.add_argument('--port', type=int, default=8000)
+    args, service_args = parser.parse_known_args(argv)
+
+    if args.host:
+        results = [asyncio.run(run_load(args.host, args.port, args.requests, args.concurrency))]
+        results[0]['mode'] = 'external'
+    else:
+        results = [run_mode(mode, service_args, args.requests, args.concurrency) for mode in args.modes]
+
+    print('{:<10} {:>10} {:>12} {:>10} {:>10}  statuses'.format('mode', 'requests', 'req/sec', 'p50 ms', 'p99 ms'))
+    for result in results:
+        print('{mode:<10} {requests:>10} {throughput:>12.1f} {p50_ms:>10.2f} {p99_ms:>10.2f}  {statuses}'.format(**result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+import cProfile
+import heapq
+import itertools
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# metric names used across the app, the batch scorer and the service
+STAGE_SECONDS = 'scotus_prediction_stage_seconds'
+PREDICTIONS = 'scotus_predictions_total'
+MODEL_CACHE_HITS = 'scotus_model_cache_hits_total'
+MODEL_LOADS = 'scotus_model_loads_total'
+MODEL_LOAD_SECONDS = 'scotus_model_load_seconds'
+BATCH_SIZE = 'scotus_batch_size'
+
+HELP = {
+    STAGE_SECONDS: 'Time spent in each stage of the prediction path.',
+    PREDICTIONS: 'Cases scored.',
+    MODEL_CACHE_HITS: 'Model lookups answered from the cache.',
+    MODEL_LOADS: 'Times the model was loaded from disk.',
+    MODEL_LOAD_SECONDS: 'Time spent loading the model.',
+    BATCH_SIZE: 'Cases per predict_proba call.',
+}
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 4096, 16384, 65536)
+
+
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+# Counters and histograms kept in process, rendered in the Prometheus text
+# exposition format. Labels are passed as keyword arguments.
+class Metrics:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, buckets=DEFAULT_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = {'buckets': buckets, 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            histogram = self.histograms[key]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    @contextmanager
+    def time(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, dict(value, counts=list(value['counts']))) for key, value in self.histograms.items())
+
+        for name, group in itertools.groupby(counters, key=lambda item: item[0][0]):
+            lines += ['# HELP {} {}'.format(name, HELP.get(name, name)), '# TYPE {} counter'.format(name)]
+            lines += ['{}{} {}'.format(name, _label_text(labels), _number(value)) for (_, labels), value in group]
+
+        for name, group in itertools.groupby(histograms, key=lambda item: item[0][0]):
+            lines += ['# HELP {} {}'.format(name, HELP.get(name, name)), '# TYPE {} histogram'.format(name)]
+            for (_, labels), histogram in group:
+                for bound, count in zip(histogram['buckets'], histogram['counts']):
+                    lines.append('{}_bucket{} {}'.format(name, _label_text(labels, [('le', _number(bound))]), count))
+                lines.append('{}_bucket{} {}'.format(name, _label_text(labels, [('le', '+Inf')]), histogram['count']))
+                lines.append('{}_sum{} {}'.format(name, _label_text(labels), repr(histogram['sum'])))
+                lines.append('{}_count{} {}'.format(name, _label_text(labels), histogram['count']))
+        return '\n'.join(lines) + '\n'
+
+
+METRICS = Metrics()
+
+
+def start_http_exporter(port, host='127.0.0.1', metrics=METRICS):
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = metrics.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# rewrites the file every interval seconds, for node_exporter's textfile collector
+def start_file_exporter(path, interval=10.0, metrics=METRICS):
+
+    def write():
+        while True:
+            temporary = path + '.tmp'
+            with open(temporary, 'w') as f:
+                f.write(metrics.render())
+            os.replace(temporary, path)
+            time.sleep(interval)
+
+    threading.Thread(target=write, daemon=True).start()
+
+
+# Keeps a cProfile profile and a tracemalloc snapshot of the slowest requests
+# seen so far. Each kept request is written to the directory as
+# <ms>ms-<id>-<name>.prof (load with pstats) and .txt (peak memory allocated
+# during the request, then the top live allocations). Only one profiler can be
+# active per process (Python 3.12 raises otherwise), so a request that starts
+# while another one is profiled runs without profiling.
+class SlowestProfiler:
+
+    def __init__(self, keep, directory):
+        self.keep = keep
+        self.directory = directory
+        self.slowest = []
+        self.ids = itertools.count()
+        self.lock = threading.Lock()
+        self.active = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def profile(self, name):
+        if not self.active.acquire(blocking=False):
+            yield
+            return
+        try:
+            profiler = cProfile.Profile()
+            tracemalloc.reset_peak()
+            allocated = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                seconds = time.perf_counter() - start
+                self.record(name, seconds, profiler, tracemalloc.get_traced_memory()[1] - allocated)
+        finally:
+            self.active.release()
+
+    def record(self, name, seconds, profiler, peak_bytes):
+        with self.lock:
+            if len(self.slowest) >= self.keep and seconds <= self.slowest[0][0]:
+                return
+            prefix = os.path.join(self.directory, '{:.1f}ms-{}-{}'.format(seconds * 1000, next(self.ids), name))
+            profiler.dump_stats(prefix + '.prof')
+            with open(prefix + '.txt', 'w') as f:
+                f.write('{} took {:.1f} ms, peak allocated {:.1f} KiB\n\n'.format(name, seconds * 1000, peak_bytes / 1024))
+                for stat in tracemalloc.take_snapshot().statistics('lineno')[:25]:
+                    f.write(str(stat) + '\n')
+
+            if len(self.slowest) >= self.keep:
+                evicted = heapq.heappushpop(self.slowest, (seconds, prefix))[1]
+                for suffix in ('.prof', '.txt'):
+                    os.remove(evicted + suffix)
+            else:
+                heapq.heappush(self.slowest, (seconds, prefix))
+
+
+_profiler = None
+_started = False
+
+
+# METRICS_PORT serves /metrics on localhost, METRICS_FILE is rewritten every
+# METRICS_INTERVAL seconds and PROFILE_SLOWEST=N keeps profiles of the N
+# slowest requests in PROFILE_DIR. Only the first call does anything.
+def configure_from_env():
+    global _profiler, _started
+    if _started:
+        return
+    _started = True
+    if os.environ.get('METRICS_PORT'):
+        start_http_exporter(int(os.environ['METRICS_PORT']))
+    if os.environ.get('METRICS_FILE'):
+        start_file_exporter(os.environ['METRICS_FILE'], float(os.environ.get('METRICS_INTERVAL', 10)))
+    if os.environ.get('PROFILE_SLOWEST'):
+        _profiler = SlowestProfiler(int(os.environ['PROFILE_SLOWEST']), os.environ.get('PROFILE_DIR', 'profiles'))
+
+
+def profile_request(name):
+    if _profiler is None:
+        return nullcontext()
+    return _profiler.profile(name)
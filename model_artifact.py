@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import struct
+import sys
+import warnings
+
+import numpy as np
+
+from forest_engine import CompiledForest, compile_forest
+from model_loader import FEATURES, load_classifier
+
+# On-disk layout of a compiled forest, meant to be np.memmap'd read-only so
+# every server process on a host shares the same page cache pages:
+#
+#   8 bytes   magic b'SCFOREST'
+#   4 bytes   format version, little endian uint32
+#   4 bytes   header length in bytes, little endian uint32
+#   header    utf-8 json: feature order, classes, array table, sha256 of data,
+#             size, mtime and sha256 of the model.zip it was compiled from
+#   data      the node arrays, uncompressed, each starting on ALIGNMENT bytes
+MAGIC = b'SCFOREST'
+VERSION = 1
+ALIGNMENT = 64
+ARRAYS = ('feature', 'threshold', 'children', 'value', 'roots')
+
+_PREFIX = struct.Struct('<8sII')
+
+
+class ArtifactError(ValueError):
+    pass
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def _sha256(path, start, length, block=1 << 22):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(block, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+# what identifies the model.zip an artifact was compiled from
+def source_stamp(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': _sha256(path, 0, stat.st_size)}
+
+
+# Written to a temporary file first and renamed over path, so processes that
+# have the old artifact mapped keep reading it and never see a partial one.
+def write_artifact(forest, path, features=FEATURES, source=None):
+    if len(features) != forest.n_features_in_:
+        raise ArtifactError('{} feature names for a forest with {} features'.format(len(features), forest.n_features_in_))
+
+    arrays = {name: np.ascontiguousarray(getattr(forest, name)) for name in ARRAYS}
+    table = {}
+    offset = 0
+    for name, array in arrays.items():
+        # little endian on disk whatever the host is
+        array = array.astype(array.dtype.newbyteorder('<'), copy=False)
+        arrays[name] = array
+        table[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _aligned(offset + array.nbytes)
+    data_length = offset
+
+    digest = hashlib.sha256()
+    for name, array in arrays.items():
+        digest.update(array)
+        digest.update(b'\0' * (_aligned(array.nbytes) - array.nbytes))
+
+    header = {
+        'features': list(features),
+        'classes': [c.item() for c in forest.classes_],
+        'n_features': forest.n_features_in_,
+        'max_depth': forest.max_depth,
+        'arrays': table,
+        'data_length': data_length,
+        'sha256': digest.hexdigest(),
+        'source': source_stamp(source) if source is not None and os.path.exists(source) else None,
+    }
+    header_bytes = json.dumps(header, sort_keys=True).encode('utf-8')
+    data_start = _aligned(_PREFIX.size + len(header_bytes))
+    header_bytes += b' ' * (data_start - _PREFIX.size - len(header_bytes))
+
+    temporary = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(temporary, 'wb') as f:
+            f.write(_PREFIX.pack(MAGIC, VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            for name, array in arrays.items():
+                f.write(array)
+                f.write(b'\0' * (_aligned(array.nbytes) - array.nbytes))
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        prefix = f.read(_PREFIX.size)
+        if len(prefix) != _PREFIX.size:
+            raise ArtifactError('{} is truncated'.format(path))
+        magic, version, header_length = _PREFIX.unpack(prefix)
+        if magic != MAGIC:
+            raise ArtifactError('{} is not a compiled forest artifact'.format(path))
+        if version != VERSION:
+            raise ArtifactError('{} has format version {}, expected {}'.format(path, version, VERSION))
+        header = json.loads(f.read(header_length).decode('utf-8'))
+    header['data_start'] = _PREFIX.size + header_length
+    return header
+
+
+# The artifact is stale when source exists and is not the model.zip it was
+# compiled from. Size and mtime are compared first, the file is only hashed
+# when they differ, e.g. after a fresh checkout of the same model.
+def _check_source(path, header, source):
+    built = header.get('source')
+    if built is None:
+        raise ArtifactError('{} does not record the model it was compiled from'.format(path))
+    stat = os.stat(source)
+    if (stat.st_size, stat.st_mtime_ns) == (built['size'], built['mtime_ns']):
+        return
+    if stat.st_size != built['size'] or _sha256(source, 0, stat.st_size) != built['sha256']:
+        raise ArtifactError('{} was compiled from a different {}'.format(path, source))
+
+
+# map the artifact read-only, rejecting it when the feature order differs
+# from what the caller feeds in, when the data does not match its checksum
+# or when it is stale against source
+def read_artifact(path, features=FEATURES, verify=True, source=None):
+    header = read_header(path)
+    if header['features'] != list(features):
+        raise ArtifactError('{} was built for features {}, expected {}'.format(path, header['features'], list(features)))
+    if source is not None and os.path.exists(source):
+        _check_source(path, header, source)
+    if verify and _sha256(path, header['data_start'], header['data_length']) != header['sha256']:
+        raise ArtifactError('{} failed its checksum'.format(path))
+
+    arrays = {}
+    for name in ARRAYS:
+        entry = header['arrays'][name]
+        arrays[name] = np.memmap(path, dtype=np.dtype(entry['dtype']), mode='r',
+                                 offset=header['data_start'] + entry['offset'], shape=tuple(entry['shape']))
+
+    return CompiledForest(max_depth=header['max_depth'], classes=header['classes'],
+                          n_features=header['n_features'], **arrays)
+
+
+# The compiled artifact when there is a valid one built from legacy_path,
+# otherwise the forest is compiled from the legacy pickle inside model.zip
+# and written to path, so the next process maps it instead of compiling its
+# own private copy.
+def load_forest(path='model.forest', legacy_path='model.zip', verify=True):
+    if os.path.exists(path):
+        try:
+            return read_artifact(path, verify=verify, source=legacy_path)
+        except ArtifactError as error:
+            warnings.warn('{}, falling back to {}'.format(error, legacy_path))
+
+    forest = compile_forest(load_classifier(legacy_path))
+    try:
+        write_artifact(forest, path, source=legacy_path)
+    except OSError as error:
+        warnings.warn('could not write {}: {}'.format(path, error))
+        return forest
+    return read_artifact(path, verify=False)
+
+
+# python model_artifact.py model.zip model.forest
+if __name__ == '__main__':
+    write_artifact(compile_forest(load_classifier(sys.argv[1])), sys.argv[2], source=sys.argv[1])
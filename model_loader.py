@@ -0,0 +1,38 @@
+import pickle
+import zipfile
+
+import numpy as np
+
+# the seven inputs collected by run_prediction(), in the column order the
+# model was trained on in Supreme_Court_Direction_Prediction.ipynb
+FEATURES = ['issue', 'caseOrigin', 'caseSource', 'certReason', 'lawType', 'naturalCourt', 'adminAction']
+
+# inclusive (min, max) accepted for every feature, same bounds as the widgets
+FEATURE_RANGES = {
+    'issue': (10010, 140070),
+    'caseOrigin': (1, 302),
+    'caseSource': (1, 302),
+    'certReason': (0, 13),
+    'lawType': (0, 8),
+    'naturalCourt': (1301, 1707),
+    'adminAction': (0, 118),
+}
+
+
+# n random cases with every feature drawn uniformly from its range
+def sample_rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.column_stack([rng.integers(FEATURE_RANGES[name][0], FEATURE_RANGES[name][1] + 1, n) for name in FEATURES])
+
+# SCDB 'direction' codes
+DIRECTIONS = {1: 'conservative', 2: 'liberal'}
+
+
+# loading in the model without any streamlit dependency, so the same
+# classifier can be used from the app and from command line tools
+def load_classifier(path='model.zip'):
+    archive = zipfile.ZipFile(path, 'r')
+    classifier = pickle.load(archive.open('model.pkl', 'r'))
+    archive.close()
+
+    return classifier
@@ -0,0 +1,272 @@
+import argparse
+import asyncio
+import json
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from metrics import BATCH_BUCKETS, BATCH_SIZE, METRICS, PREDICTIONS, STAGE_SECONDS, configure_from_env, profile_request
+from model_loader import DIRECTIONS, FEATURES, FEATURE_RANGES
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+MAX_BODY = 1 << 16
+
+
+class HTTPError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# same contract as prediction() in App.py: the seven features as integers
+def parse_case(payload):
+    if not isinstance(payload, dict):
+        raise HTTPError(400, 'expected a json object with ' + ', '.join(FEATURES))
+    row = []
+    for name in FEATURES:
+        value = payload.get(name)
+        # ints are never converted to float, json allows ints too large for one
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or (
+                isinstance(value, float) and not (math.isfinite(value) and value.is_integer())):
+            raise HTTPError(400, '{} must be an integer'.format(name))
+        low, high = FEATURE_RANGES[name]
+        if not low <= value <= high:
+            raise HTTPError(400, '{} must be between {} and {}'.format(name, low, high))
+        row.append(int(value))
+    return row
+
+
+# Collects concurrent requests into one predict_proba call. A batch is sent
+# to the model when it holds max_batch cases or when its oldest case waited
+# max_wait seconds; the model runs on a worker thread so the event loop keeps
+# accepting requests meanwhile. The queue is bounded, a full queue is reported
+# to the caller instead of growing without limit.
+class MicroBatcher:
+
+    def __init__(self, model, max_batch=64, max_wait=0.005, max_queue=1024):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = asyncio.Queue(max_queue)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.batches = 0
+        self.cases = 0
+
+    def submit(self, row):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((row, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            raise HTTPError(503, 'prediction queue is full')
+        return future
+
+    # sklearn models fitted on a DataFrame are given one with the same columns
+    def predict(self, rows):
+        if getattr(self.model, 'feature_names_in_', None) is not None:
+            rows = pd.DataFrame(rows, columns=FEATURES)
+        with profile_request('batch'):
+            return self.model.predict_proba(rows)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            started = time.perf_counter()
+            for row, future, queued in batch:
+                METRICS.observe(STAGE_SECONDS, started - queued, stage='queue', source='service')
+            METRICS.observe(BATCH_SIZE, len(batch), buckets=BATCH_BUCKETS, source='service')
+
+            rows = np.array([row for row, future, queued in batch], dtype=np.float32)
+            try:
+                proba = await loop.run_in_executor(self.executor, self.predict, rows)
+            except Exception as error:
+                for row, future, queued in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+
+            METRICS.observe(STAGE_SECONDS, time.perf_counter() - started, stage='predict', source='service')
+            METRICS.inc(PREDICTIONS, len(batch), source='service')
+            self.batches += 1
+            self.cases += len(batch)
+            for (row, future, queued), p in zip(batch, proba):
+                if not future.done():
+                    future.set_result(p)
+
+
+class PredictionService:
+
+    def __init__(self, load_model, max_batch=64, max_wait=0.005, max_queue=1024):
+        self.load_model = load_model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.batcher = None
+        self.tasks = []
+
+    @property
+    def ready(self):
+        return self.batcher is not None
+
+    async def start(self, host='127.0.0.1', port=8000):
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        self.tasks.append(asyncio.create_task(self.warm_up()))
+        return self.server
+
+    # the model is loaded after the socket is open, so /healthz answers
+    # right away and /readyz turns 200 once predictions can be served
+    async def warm_up(self):
+        model = await asyncio.get_running_loop().run_in_executor(None, self.load_model)
+        self.classes = [DIRECTIONS.get(int(c), str(c)) for c in model.classes_]
+        self.batcher = MicroBatcher(model, self.max_batch, self.max_wait, self.max_queue)
+        self.tasks.append(asyncio.create_task(self.batcher.run()))
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await self.read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                try:
+                    status, payload = await self.route(method, path, body)
+                except HTTPError as error:
+                    status, payload = error.status, {'error': str(error)}
+                except Exception as error:
+                    status, payload = 500, {'error': repr(error)}
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                self.write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except HTTPError as error:
+            self.write_response(writer, error.status, {'error': str(error)}, False)
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        try:
+            method, path, _ = line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            raise HTTPError(400, 'malformed request line')
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HTTPError(400, 'invalid content-length')
+        if length < 0:
+            raise HTTPError(400, 'invalid content-length')
+        if length > MAX_BODY:
+            raise HTTPError(413, 'request body is too large')
+        body = await reader.readexactly(length) if length else b''
+        return method, path, headers, body
+
+    async def route(self, method, path, body):
+        if path == '/healthz':
+            return 200, {'status': 'ok'}
+        if path == '/metrics':
+            return 200, METRICS.render()
+        if path == '/readyz':
+            if not self.ready:
+                return 503, {'status': 'loading'}
+            return 200, {'status': 'ready', 'batches': self.batcher.batches, 'cases': self.batcher.cases,
+                         'queued': self.batcher.queue.qsize()}
+        if path != '/predict':
+            raise HTTPError(404, 'no route for ' + path)
+        if method != 'POST':
+            raise HTTPError(405, 'use POST')
+        if not self.ready:
+            raise HTTPError(503, 'model is still loading')
+
+        try:
+            row = parse_case(json.loads(body or b'null'))
+        except ValueError:
+            raise HTTPError(400, 'body is not valid json')
+        with METRICS.time(STAGE_SECONDS, stage='request', source='service'):
+            proba = await self.batcher.submit(row)
+        best = int(np.argmax(proba))
+        return 200, {'direction': self.classes[best], 'probability': float(proba[best]),
+                     'probabilities': dict(zip(self.classes, map(float, proba)))}
+
+    # json for dicts, plain text for strings such as the /metrics page
+    def write_response(self, writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode('utf-8'), 'text/plain; version=0.0.4'
+        else:
+            body, content_type = json.dumps(payload).encode('utf-8'), 'application/json'
+        head = 'HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: {}\r\n'.format(
+            status, REASONS.get(status, ''), content_type, len(body), 'keep-alive' if keep_alive else 'close')
+        if status == 503:
+            head += 'Retry-After: 1\r\n'
+        writer.write(head.encode('latin-1') + b'\r\n' + body)
+
+
+def model_loader(backend, artifact, legacy):
+    if backend == 'sklearn':
+        from model_loader import load_classifier
+        return lambda: load_classifier(legacy)
+    from model_artifact import load_forest
+    return lambda: load_forest(artifact, legacy)
+
+
+async def serve(args):
+    configure_from_env()
+    service = PredictionService(model_loader(args.backend, args.artifact, args.model),
+                                args.max_batch, args.max_wait / 1000, args.max_queue)
+    server = await service.start(args.host, args.port)
+    print('listening on http://{}:{}'.format(args.host, args.port), flush=True)
+    start = time.perf_counter()
+    await service.tasks[0]
+    print('model ready after {:.2f}s'.format(time.perf_counter() - start), flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='JSON prediction service with dynamic micro-batching')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--backend', choices=['engine', 'sklearn'], default='engine')
+    parser.add_argument('--artifact', default='model.forest')
+    parser.add_argument('--model', default='model.zip')
+    parser.add_argument('--max-batch', type=int, default=64)
+    parser.add_argument('--max-wait', type=float, default=5.0, help='milliseconds')
+    parser.add_argument('--max-queue', type=int, default=1024)
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
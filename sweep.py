@@ -0,0 +1,97 @@
+import itertools
+
+import numpy as np
+
+from model_loader import FEATURES, FEATURE_RANGES
+
+MAX_SWEEP_POINTS = 1000000
+
+
+def sweep_values(name):
+    low, high = FEATURE_RANGES[name]
+    return np.arange(low, high + 1)
+
+
+# Class probabilities for a base case with one or two of its features swept
+# over the given ascending values, or their cartesian product. The result has
+# shape (len(values[0]), [len(values[1]),] n_classes).
+#
+# Rather than scoring every grid point, the trees are walked once with the
+# base case: nodes splitting on a swept feature send a box of grid indices to
+# both children, cut at the threshold, every other node follows the base case.
+# Each tree ends up with a few boxes, each lying in one leaf, and the leaf
+# probabilities are added over their boxes with a difference array. The cost
+# grows with the number of leaves reached, not with the size of the grid.
+def sweep_proba(forest, base, names, values=None):
+    if values is None:
+        values = [sweep_values(name) for name in names]
+    values = [np.asarray(v) for v in values]
+    if any(np.any(np.diff(v) <= 0) for v in values):
+        raise ValueError('sweep values must be strictly ascending')
+    shape = tuple(len(v) for v in values)
+    if int(np.prod(shape)) > MAX_SWEEP_POINTS:
+        raise ValueError('a sweep is limited to {} points'.format(MAX_SWEEP_POINTS))
+
+    base = np.asarray(base, dtype=np.float32)
+    swept_features = [FEATURES.index(name) for name in names]
+    feature = np.asarray(forest.feature)
+    threshold = np.asarray(forest.threshold)
+    children = np.asarray(forest.children).reshape(-1, 2)
+
+    nodes = np.asarray(forest.roots, dtype=np.int64)
+    low = np.zeros((len(nodes), len(shape)), dtype=np.int64)
+    high = np.tile(np.array(shape, dtype=np.int64) - 1, (len(nodes), 1))
+    for _ in range(forest.max_depth):
+        f = feature[nodes]
+        t = threshold[nodes]
+        follow = ~np.isin(f, swept_features) | ~np.isfinite(t)
+        next_nodes = [children[nodes[follow], (base[f[follow]] > t[follow]).astype(np.int64)]]
+        next_low, next_high = [low[follow]], [high[follow]]
+
+        for d, j in enumerate(swept_features):
+            split = ~follow & (f == j)
+            if not split.any():
+                continue
+            # grid indices 0..cut have values <= threshold and go left
+            cut = np.searchsorted(values[d], t[split], side='right') - 1
+            left_high = high[split].copy()
+            left_high[:, d] = np.minimum(left_high[:, d], cut)
+            right_low = low[split].copy()
+            right_low[:, d] = np.maximum(right_low[:, d], cut + 1)
+
+            left = low[split][:, d] <= left_high[:, d]
+            right = right_low[:, d] <= high[split][:, d]
+            next_nodes += [children[nodes[split], 0][left], children[nodes[split], 1][right]]
+            next_low += [low[split][left], right_low[right]]
+            next_high += [left_high[left], high[split][right]]
+
+        nodes = np.concatenate(next_nodes)
+        low = np.concatenate(next_low)
+        high = np.concatenate(next_high)
+
+    value = np.asarray(forest.value, dtype=np.float64)[nodes]
+    totals = np.zeros(tuple(n + 1 for n in shape) + (value.shape[1],))
+    for corner in itertools.product((0, 1), repeat=len(shape)):
+        index = tuple(high[:, d] + 1 if c else low[:, d] for d, c in enumerate(corner))
+        np.add.at(totals, index, value if sum(corner) % 2 == 0 else -value)
+    for axis in range(len(shape)):
+        totals = np.cumsum(totals, axis=axis)
+
+    return totals[tuple(slice(0, n) for n in shape)] / forest.n_trees
+
+
+# Averages runs of consecutive swept values so that no axis has more than
+# max_cells values left, for charts that cannot draw every value. Returns the
+# first value of every run and the averaged probabilities.
+def coarsen(values, proba, max_cells):
+    values = list(values)
+    for axis, v in enumerate(values):
+        step = -(-len(v) // max_cells)
+        if step == 1:
+            continue
+        starts = np.arange(0, len(v), step)
+        counts = np.diff(np.append(starts, len(v)))
+        shape = [len(starts) if a == axis else 1 for a in range(proba.ndim)]
+        proba = np.add.reduceat(proba, starts, axis=axis) / counts.reshape(shape)
+        values[axis] = v[starts]
+    return values, proba
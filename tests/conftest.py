@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from forest_engine import compile_forest
+from model_loader import FEATURES, sample_rows
+
+
+# integer codes in the app's ranges, the direction depends on a few of them
+# so the trees split on more than noise
+def synthetic_cases(n, seed=0):
+    x = sample_rows(n, seed)
+    rng = np.random.default_rng(seed + 1)
+    score = (x[:, 4] >= 4) + (x[:, 3] % 3 == 0) + (x[:, 5] > 1500) + rng.random(n)
+    y = np.where(score > 1.5, 1, 2)
+    return pd.DataFrame(x, columns=FEATURES), y
+
+
+@pytest.fixture(scope='session')
+def classifier():
+    x, y = synthetic_cases(2000)
+    return RandomForestClassifier(n_estimators=40, max_depth=8, random_state=0).fit(x, y)
+
+
+# a different model for the same features, stands in for a retrained model.zip
+@pytest.fixture(scope='session')
+def replaced_classifier():
+    x, y = synthetic_cases(500, seed=3)
+    return RandomForestClassifier(n_estimators=5, max_depth=3, random_state=1).fit(x, y)
+
+
+@pytest.fixture(scope='session')
+def forest(classifier):
+    return compile_forest(classifier)
+
+
+@pytest.fixture(scope='session')
+def cases():
+    x, _ = synthetic_cases(500, seed=7)
+    # repeated rows go through the deduplication in predict_proba
+    return pd.concat([x, x.iloc[:100]], ignore_index=True)
@@ -0,0 +1,50 @@
+import io
+
+import pandas as pd
+import pytest
+
+from batch_predict import coerce_features, score_csv
+from model_loader import FEATURES
+
+GOOD = [80180, 1, 1, 1, 1, 1301, 0]
+
+
+def frame(*rows):
+    return pd.DataFrame([[str(value) for value in row] for row in rows], columns=FEATURES)
+
+
+def test_coerce_marks_unusable_rows_invalid():
+    non_numeric = ['abc'] + GOOD[1:]
+    fractional = GOOD[:3] + ['1.5'] + GOOD[4:]
+    empty = GOOD[:4] + [''] + GOOD[5:]
+    out_of_range = GOOD[:5] + [1708, 0]
+    features, valid = coerce_features(frame(GOOD, non_numeric, fractional, empty, out_of_range, GOOD[:6] + ['3.0']))
+    assert valid.tolist() == [True, False, False, False, False, True]
+    assert features[0].tolist() == GOOD
+    assert (features[1:5] == 0).all()
+
+
+def test_coerce_rejects_missing_column():
+    with pytest.raises(ValueError, match='lawType'):
+        coerce_features(frame(GOOD).drop(columns='lawType'))
+
+
+def test_score_csv_writes_header_once(classifier, cases):
+    source = io.StringIO(cases.to_csv(index=False))
+    destination = io.StringIO()
+    stats = score_csv(classifier, source, destination, chunksize=128)
+    assert stats['rows'] == len(cases) and stats['invalid'] == 0
+
+    scored = pd.read_csv(io.StringIO(destination.getvalue()))
+    assert list(scored.columns) == FEATURES + ['direction', 'probability']
+    assert destination.getvalue().count('issue,') == 1
+    pd.testing.assert_frame_equal(scored[FEATURES], cases, check_dtype=False)
+    expected = classifier.predict(cases)
+    assert (scored['direction'] == pd.Series(expected).map({1: 'conservative', 2: 'liberal'})).all()
+
+
+def test_score_csv_header_only(classifier):
+    destination = io.StringIO()
+    stats = score_csv(classifier, io.StringIO(','.join(FEATURES) + '\n'), destination)
+    assert stats['rows'] == 0
+    assert destination.getvalue().splitlines() == [','.join(FEATURES + ['direction', 'probability'])]
@@ -0,0 +1,35 @@
+import numpy as np
+
+from compact import build, greedy_order, merge_subtrees, quantize, tree_probabilities
+
+
+def test_early_exit_labels_match_predict(forest, cases):
+    x = cases.to_numpy()
+    labels, evaluated = forest.predict_early_exit(x, block_trees=4)
+    np.testing.assert_array_equal(labels, forest.predict(x))
+    assert evaluated.min() >= 4 and evaluated.max() <= forest.n_trees
+    assert evaluated.mean() < forest.n_trees
+
+
+def test_merge_subtrees_keeps_output(forest, cases):
+    x = cases.to_numpy()
+    merged = merge_subtrees(forest)
+    assert merged.n_nodes < forest.n_nodes
+    np.testing.assert_array_equal(merged.predict_proba(x), forest.predict_proba(x))
+    # selecting trees walks the shared nodes of the merged table
+    np.testing.assert_array_equal(merged.select([3, 1]).predict_proba(x), forest.select([3, 1]).predict_proba(x))
+
+
+def test_quantized_thresholds_keep_leaves(forest, cases):
+    x = cases.to_numpy()
+    quantized = quantize(forest)
+    np.testing.assert_array_equal(quantized.apply(x), forest.apply(x))
+    assert np.abs(quantized.predict_proba(x) - forest.predict_proba(x)).max() <= 1 / 512
+
+
+def test_greedy_order_is_a_permutation(forest, cases):
+    x = cases.to_numpy()
+    target = (forest.predict(x) == forest.classes_[1]).astype(np.float64)
+    order = greedy_order(tree_probabilities(forest, x), target, np.ones(len(x)), 10)
+    assert sorted(order) == list(range(forest.n_trees))
+    assert build(forest, order, 10).n_trees == 10
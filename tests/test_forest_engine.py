@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+
+def test_single_row_matches_sklearn(classifier, forest, cases):
+    for i in range(20):
+        row = cases.iloc[[i]]
+        np.testing.assert_array_equal(forest.predict_proba(row.to_numpy()), classifier.predict_proba(row))
+
+
+@pytest.mark.parametrize('size', [2, 100, 600])
+def test_batch_matches_sklearn(classifier, forest, cases, size):
+    x = cases.iloc[:size]
+    np.testing.assert_array_equal(forest.predict_proba(x.to_numpy()), classifier.predict_proba(x))
+    np.testing.assert_array_equal(forest.predict(x.to_numpy()), classifier.predict(x))
+
+
+def test_row_blocks_match_one_block(forest, cases):
+    x = cases.to_numpy()
+    np.testing.assert_array_equal(forest.predict_proba(x, block_nodes=forest.n_trees * 7), forest.predict_proba(x))
+
+
+def test_rejects_wrong_feature_count(forest):
+    with pytest.raises(ValueError):
+        forest.predict_proba(np.zeros((1, 3)))
+
@@ -0,0 +1,74 @@
+import os
+import threading
+import time
+import tracemalloc
+
+import pytest
+
+from metrics import Metrics, SlowestProfiler
+
+
+@pytest.fixture
+def profiler(tmp_path):
+    tracing = tracemalloc.is_tracing()
+    yield SlowestProfiler(2, str(tmp_path))
+    if not tracing:
+        tracemalloc.stop()
+
+
+def test_render_counters_and_cumulative_buckets():
+    metrics = Metrics()
+    metrics.inc('requests_total', source='app')
+    metrics.inc('requests_total', 2, source='app')
+    for value in (0.5, 1.5, 1.5, 7):
+        metrics.observe('latency_seconds', value, buckets=(1, 2, 5), stage='predict')
+
+    lines = metrics.render().splitlines()
+    assert '# TYPE requests_total counter' in lines
+    assert 'requests_total{source="app"} 3' in lines
+    assert lines[-6:] == [
+        'latency_seconds_bucket{stage="predict",le="1"} 1',
+        'latency_seconds_bucket{stage="predict",le="2"} 3',
+        'latency_seconds_bucket{stage="predict",le="5"} 3',
+        'latency_seconds_bucket{stage="predict",le="+Inf"} 4',
+        'latency_seconds_sum{stage="predict"} 10.5',
+        'latency_seconds_count{stage="predict"} 4',
+    ]
+
+
+def test_render_escapes_label_values():
+    metrics = Metrics()
+    metrics.inc('errors_total', path='C:\\cases\\"new".csv')
+    assert 'errors_total{path="C:\\\\cases\\\\\\"new\\".csv"} 1' in metrics.render().splitlines()
+
+
+def test_profiler_keeps_the_slowest(profiler, tmp_path):
+    for name, seconds in [('a', 0.01), ('b', 0.06), ('c', 0.02), ('d', 0.04), ('e', 0.005)]:
+        with profiler.profile(name):
+            time.sleep(seconds)
+
+    files = sorted(os.listdir(tmp_path))
+    assert len(files) == 4
+    assert sorted(name.rsplit('-', 1)[1] for name in files) == ['b.prof', 'b.txt', 'd.prof', 'd.txt']
+
+
+def test_profiler_skips_a_request_while_another_is_profiled(profiler, tmp_path):
+    errors = []
+
+    def concurrent():
+        try:
+            with profiler.profile('inner'):
+                pass
+        except Exception as error:
+            errors.append(error)
+
+    with profiler.profile('outer'):
+        thread = threading.Thread(target=concurrent)
+        thread.start()
+        thread.join()
+        # the same thread entering again is skipped too
+        with profiler.profile('nested'):
+            pass
+
+    assert errors == []
+    assert sorted(name.rsplit('-', 1)[1] for name in os.listdir(tmp_path)) == ['outer.prof', 'outer.txt']
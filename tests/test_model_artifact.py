@@ -0,0 +1,93 @@
+import os
+import warnings
+
+import numpy as np
+import pytest
+
+from model_artifact import ArtifactError, load_forest, read_artifact, read_header, write_artifact
+from model_loader import FEATURES
+from train import save_model
+
+
+@pytest.fixture
+def model_zip(classifier, tmp_path):
+    path = str(tmp_path / 'model.zip')
+    save_model(classifier, path)
+    return path
+
+
+def test_round_trip(forest, cases, tmp_path):
+    path = str(tmp_path / 'model.forest')
+    write_artifact(forest, path)
+    loaded = read_artifact(path)
+    assert isinstance(loaded.feature, np.memmap)
+    assert loaded.max_depth == forest.max_depth
+    np.testing.assert_array_equal(loaded.classes_, forest.classes_)
+    np.testing.assert_array_equal(loaded.predict_proba(cases.to_numpy()), forest.predict_proba(cases.to_numpy()))
+    assert [name for name in os.listdir(tmp_path)] == ['model.forest']
+
+
+def test_rejects_other_feature_order(forest, tmp_path):
+    path = str(tmp_path / 'model.forest')
+    write_artifact(forest, path)
+    with pytest.raises(ArtifactError, match='features'):
+        read_artifact(path, features=FEATURES[::-1])
+
+
+def test_rejects_corrupted_data(forest, tmp_path):
+    path = str(tmp_path / 'model.forest')
+    write_artifact(forest, path)
+    with open(path, 'r+b') as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 0xff]))
+    with pytest.raises(ArtifactError, match='checksum'):
+        read_artifact(path)
+    read_artifact(path, verify=False)
+
+
+def test_rejects_other_files(tmp_path):
+    path = str(tmp_path / 'model.forest')
+    with open(path, 'wb') as f:
+        f.write(b'PK\x03\x04' + b'\0' * 60)
+    with pytest.raises(ArtifactError, match='not a compiled forest'):
+        read_artifact(path)
+
+
+def test_load_writes_missing_artifact(model_zip, forest, cases, tmp_path):
+    path = str(tmp_path / 'model.forest')
+    loaded = load_forest(path, model_zip)
+    assert isinstance(loaded.feature, np.memmap)
+    assert read_header(path)['source']['sha256']
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        again = load_forest(path, model_zip)
+    np.testing.assert_array_equal(again.predict_proba(cases.to_numpy()), forest.predict_proba(cases.to_numpy()))
+
+
+def test_load_rejects_stale_artifact(model_zip, forest, replaced_classifier, cases, tmp_path):
+    path = str(tmp_path / 'model.forest')
+    write_artifact(forest, path, source=model_zip)
+
+    save_model(replaced_classifier, model_zip)
+    with pytest.warns(UserWarning, match='different'):
+        loaded = load_forest(path, model_zip)
+    np.testing.assert_array_equal(loaded.predict_proba(cases.to_numpy()), replaced_classifier.predict_proba(cases))
+    # the rebuilt artifact is used from now on
+    assert read_artifact(path, source=model_zip).n_trees == 5
+
+
+def test_load_accepts_same_model_with_new_mtime(model_zip, forest, tmp_path):
+    path = str(tmp_path / 'model.forest')
+    write_artifact(forest, path, source=model_zip)
+    stat = os.stat(model_zip)
+    os.utime(model_zip, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    read_artifact(path, source=model_zip)
+
+
+def test_load_rejects_artifact_without_source(model_zip, forest, tmp_path):
+    path = str(tmp_path / 'model.forest')
+    write_artifact(forest, path)
+    with pytest.raises(ArtifactError, match='does not record'):
+        read_artifact(path, source=model_zip)
@@ -0,0 +1,160 @@
+import asyncio
+import json
+import threading
+
+import numpy as np
+import pytest
+
+from model_loader import FEATURES
+from service import HTTPError, MicroBatcher, PredictionService, parse_case
+
+CASE = dict(zip(FEATURES, [80180, 1, 1, 1, 1, 1301, 0]))
+
+
+# the compiled forest behind a gate: records every batch it is given and
+# blocks inside predict_proba until released
+class GatedModel:
+
+    def __init__(self, forest, open=True):
+        self.forest = forest
+        self.classes_ = forest.classes_
+        self.sizes = []
+        self.entered = threading.Event()
+        self.release = threading.Event()
+        if open:
+            self.release.set()
+
+    def predict_proba(self, rows):
+        self.sizes.append(len(rows))
+        self.entered.set()
+        self.release.wait(5)
+        return self.forest.predict_proba(rows)
+
+
+async def request(port, method, path, payload=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    body = b'' if payload is None else json.dumps(payload).encode('utf-8')
+    writer.write('{} {} HTTP/1.1\r\nContent-Length: {}\r\nConnection: close\r\n\r\n'.format(
+        method, path, len(body)).encode('latin-1') + body)
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+
+async def start(service):
+    server = await service.start(port=0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def stop(server, service):
+    server.close()
+    for task in service.tasks:
+        task.cancel()
+
+
+def test_parse_case_accepts_integers():
+    assert parse_case(CASE) == [80180, 1, 1, 1, 1, 1301, 0]
+    assert parse_case(dict(CASE, issue=80180.0)) == [80180, 1, 1, 1, 1, 1301, 0]
+
+
+@pytest.mark.parametrize('value, message', [
+    (True, 'integer'), ('80180', 'integer'), (None, 'integer'), (80180.5, 'integer'), (float('nan'), 'integer'),
+    (float('inf'), 'integer'), (10009, 'between'), (140071, 'between'), (10 ** 400, 'between'), (-10 ** 400, 'between'),
+    (1e308, 'between'),
+])
+def test_parse_case_rejects(value, message):
+    with pytest.raises(HTTPError, match=message) as error:
+        parse_case(dict(CASE, issue=value))
+    assert error.value.status == 400
+
+
+def test_parse_case_rejects_non_objects():
+    with pytest.raises(HTTPError, match='json object'):
+        parse_case([80180, 1, 1, 1, 1, 1301, 0])
+
+
+def test_batcher_groups_concurrent_submits(forest, cases):
+    rows = cases.to_numpy()[:10]
+
+    async def scenario():
+        model = GatedModel(forest)
+        batcher = MicroBatcher(model, max_batch=4, max_wait=0.05)
+        runner = asyncio.create_task(batcher.run())
+        futures = [batcher.submit(list(row)) for row in rows]
+        results = await asyncio.gather(*futures)
+        runner.cancel()
+        return model.sizes, results
+
+    sizes, results = asyncio.run(scenario())
+    assert sizes == [4, 4, 2]
+    np.testing.assert_array_equal(np.array(results), forest.predict_proba(rows.astype(np.float32)))
+
+
+def test_full_queue_answers_503(forest):
+
+    async def scenario():
+        model = GatedModel(forest, open=False)
+        service = PredictionService(lambda: model, max_batch=1, max_queue=1)
+        server, port = await start(service)
+        try:
+            await service.tasks[0]
+            first = asyncio.create_task(request(port, 'POST', '/predict', CASE))
+            await asyncio.get_running_loop().run_in_executor(None, model.entered.wait, 5)
+            second = asyncio.create_task(request(port, 'POST', '/predict', CASE))
+            while service.batcher.queue.qsize() < 1:
+                await asyncio.sleep(0.001)
+            rejected = await request(port, 'POST', '/predict', CASE)
+        finally:
+            model.release.set()
+        answered = [await first, await second]
+        stop(server, service)
+        return rejected, answered
+
+    rejected, answered = asyncio.run(scenario())
+    assert rejected == (503, {'error': 'prediction queue is full'})
+    assert [status for status, payload in answered] == [200, 200]
+
+
+def test_ready_only_after_warm_up(forest):
+    loading = threading.Event()
+
+    def load_model():
+        loading.wait(5)
+        return forest
+
+    async def scenario():
+        service = PredictionService(load_model)
+        server, port = await start(service)
+        try:
+            before = [await request(port, 'GET', '/readyz'), await request(port, 'GET', '/healthz'),
+                      await request(port, 'POST', '/predict', CASE)]
+        finally:
+            loading.set()
+        await service.tasks[0]
+        after = [await request(port, 'GET', '/readyz'), await request(port, 'POST', '/predict', CASE)]
+        stop(server, service)
+        return before, after
+
+    before, after = asyncio.run(scenario())
+    assert [status for status, payload in before] == [503, 200, 503]
+    assert before[0][1] == {'status': 'loading'}
+    assert [status for status, payload in after] == [200, 200]
+    assert after[1][1]['direction'] in ('conservative', 'liberal')
+
+
+def test_negative_content_length_answers_400(forest):
+
+    async def scenario():
+        service = PredictionService(lambda: forest)
+        server, port = await start(service)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b'POST /predict HTTP/1.1\r\nContent-Length: -1\r\n\r\n')
+        response = await reader.read()
+        writer.close()
+        stop(server, service)
+        return response
+
+    response = asyncio.run(scenario())
+    assert response.startswith(b'HTTP/1.1 400 ')
+    assert response.endswith(b'{"error": "invalid content-length"}')
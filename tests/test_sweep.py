@@ -0,0 +1,55 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from model_loader import FEATURES
+from sweep import MAX_SWEEP_POINTS, coarsen, sweep_proba, sweep_values
+
+BASE = (80180, 27, 28, 1, 2, 1501, 0)
+
+
+def brute_force(forest, base, names, values):
+    rows = []
+    for point in itertools.product(*values):
+        row = list(base)
+        for name, value in zip(names, point):
+            row[FEATURES.index(name)] = value
+        rows.append(row)
+    return forest.predict_proba(np.array(rows)).reshape(tuple(len(v) for v in values) + (-1,))
+
+
+@pytest.mark.parametrize('name', FEATURES[1:])
+def test_one_input_matches_brute_force(forest, name):
+    values = [sweep_values(name)]
+    np.testing.assert_allclose(sweep_proba(forest, BASE, [name]), brute_force(forest, BASE, [name], values), atol=1e-12)
+
+
+@pytest.mark.parametrize('names', [('certReason', 'lawType'), ('lawType', 'naturalCourt'), ('caseOrigin', 'caseSource')])
+def test_two_inputs_match_brute_force(forest, names):
+    values = [sweep_values(name) for name in names]
+    np.testing.assert_allclose(sweep_proba(forest, BASE, names), brute_force(forest, BASE, names, values), atol=1e-12)
+
+
+def test_given_values_match_brute_force(forest):
+    names = ('issue', 'adminAction')
+    values = [np.arange(10010, 140070, 997), np.array([0, 3, 50, 117])]
+    np.testing.assert_allclose(sweep_proba(forest, BASE, names, values), brute_force(forest, BASE, names, values),
+                               atol=1e-12)
+
+
+def test_rejects_large_and_unsorted_sweeps(forest):
+    with pytest.raises(ValueError, match=str(MAX_SWEEP_POINTS)):
+        sweep_proba(forest, BASE, ['issue', 'lawType'])
+    with pytest.raises(ValueError, match='ascending'):
+        sweep_proba(forest, BASE, ['lawType'], [np.array([3, 1, 2])])
+
+
+def test_coarsen_averages_runs():
+    values = [np.arange(10), np.arange(3)]
+    proba = np.arange(30, dtype=np.float64).reshape(10, 3)
+    shown, averaged = coarsen(values, proba, 4)
+    np.testing.assert_array_equal(shown[0], [0, 3, 6, 9])
+    np.testing.assert_array_equal(shown[1], values[1])
+    np.testing.assert_array_equal(averaged[:, 0], [3, 12, 21, 27])
+    assert coarsen(values, proba, 10)[1] is proba
@@ -0,0 +1,94 @@
+import os
+
+import numpy as np
+import pytest
+
+import train
+from model_loader import FEATURES, sample_rows
+from train import collapse, group_split, load_features, read_features
+
+COLUMNS = ['caseId', 'dateDecision', 'caseName'] + FEATURES + ['direction']
+# caseId, dateDecision, caseName, seven codes ('' is missing), direction
+ROWS = [
+    ('2014-001', '12/31/2014', 'Old v. Case', 80180, 1, 1, 1, 1, 1301, 0, 1),
+    ('2015-001', '1/1/2015', 'On v. Start', 80180, 1, 1, 1, 1, 1301, 0, 1),
+    ('2015-002', '1/5/2015', 'Café v. État', 20050, 27, 28, 1, 2, 1704, '', 2),
+    ('2015-002', '1/5/2015', 'Café v. État', 20050, 27, 28, 1, 2, 1704, '', 2),
+    ('2015-003', '3/2/2015', 'No v. Direction', 30010, 3, 3, 4, 6, 1704, 0, ''),
+    ('2016-001', '10/31/2016', 'Section § v. Clause', 10020, '', 301, '', 1, 1705, 3, 1),
+    ('2016-001', '10/31/2016', 'Section § v. Clause', 10020, '', 301, '', 1, 1705, 3, 2),
+    ('2016-002', '11/7/2016', 'Late v. Case', 90120, 302, 5, 10, 8, 1705, 118, 2),
+]
+EXPECTED_X = [
+    [20050, 27, 28, 1, 2, 1704, 0],
+    [20050, 27, 28, 1, 2, 1704, 0],
+    [10020, 0, 301, 0, 1, 1705, 3],
+    [10020, 0, 301, 0, 1, 1705, 3],
+    [90120, 302, 5, 10, 8, 1705, 118],
+]
+
+
+@pytest.fixture
+def scdb(tmp_path):
+    path = str(tmp_path / 'scdb.csv')
+    with open(path, 'w', encoding='Windows-1252', newline='') as f:
+        f.write(','.join(COLUMNS) + '\r\n')
+        for row in ROWS:
+            f.write(','.join(str(value) for value in row) + '\r\n')
+    return path
+
+
+# like the justice centered file: every case repeated once per justice, the
+# justices of a case mostly agree on the direction
+def justice_rows(n_cases, seed=0):
+    rng = np.random.default_rng(seed)
+    groups = np.repeat(np.arange(n_cases), 9).astype(np.int32)
+    x = sample_rows(n_cases, seed)[groups].astype(np.int32)
+    y = np.where(rng.random(len(groups)) < 0.8, 1 + groups % 2, 2 - groups % 2).astype(np.int8)
+    return x, y, groups
+
+
+@pytest.mark.parametrize('chunksize', [1, 3, 100000])
+def test_read_features_cleans_like_the_notebook(scdb, chunksize):
+    x, y, groups = read_features(scdb, chunksize=chunksize)
+    # decided strictly after 2015-01-01, rows without a direction dropped, missing codes as 0
+    np.testing.assert_array_equal(x, EXPECTED_X)
+    np.testing.assert_array_equal(y, [2, 2, 1, 2, 2])
+    np.testing.assert_array_equal(groups, [0, 0, 1, 1, 2])
+    assert x.dtype == np.int32 and y.dtype == np.int8
+
+
+def test_load_features_reuses_the_cache(scdb, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    first = load_features(scdb, cache_dir=cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+
+    def unexpected(*args, **kwargs):
+        raise AssertionError('the csv was parsed again')
+
+    monkeypatch.setattr(train, 'read_features', unexpected)
+    second = load_features(scdb, cache_dir=cache_dir)
+    for a, b in zip(first, second):
+        np.testing.assert_array_equal(a, b)
+        assert a.dtype == b.dtype
+
+
+def test_collapse_keeps_every_row_as_weight():
+    x, y, groups = justice_rows(200)
+    cx, cy, weights = collapse(x, y)
+    assert weights.sum() == len(y)
+    assert len(cy) < len(y) / 4
+    rows = np.column_stack([cx, cy])
+    assert len(np.unique(rows, axis=0)) == len(rows)
+    # every weight is the number of copies of its row in the input
+    for row, weight in zip(rows[:20], weights[:20]):
+        assert (np.column_stack([x, y]) == row).all(axis=1).sum() == weight
+
+
+def test_group_split_keeps_cases_together():
+    x, y, groups = justice_rows(300)
+    train_index, test_index = group_split(groups)
+    assert len(train_index) + len(test_index) == len(groups)
+    assert not set(groups[train_index]) & set(groups[test_index])
+    assert 0.25 < len(np.unique(groups[test_index])) / 300 < 0.4
+    np.testing.assert_array_equal(group_split(groups)[1], test_index)
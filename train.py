@@ -0,0 +1,199 @@
+import argparse
+import hashlib
+import os
+import pickle
+import resource
+import sys
+import time
+import zipfile
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score, roc_auc_score
+from sklearn.model_selection import GroupShuffleSplit, train_test_split
+
+from model_loader import FEATURES
+
+DEFAULT_SOURCE = 'SCDB_2020_01_justiceCentered_Citation.csv'
+DEFAULT_CACHE_DIR = '.train_cache'
+START_DATE = '2015-01-01'
+CACHE_VERSION = 2
+
+# only these columns are parsed, everything else in the SCDB file is skipped.
+# the codes are small integers but can be missing, float32 keeps them compact
+# and still holds NaN until it is filled like in the notebook. caseId is only
+# read to keep the justice rows of one case together when splitting
+READ_DTYPES = dict({name: np.float32 for name in FEATURES}, direction=np.float32, dateDecision=str, caseId=str)
+
+
+# Wall time and peak resident memory of every stage. On Linux the peak is
+# reset before each stage through /proc/self/clear_refs, elsewhere the number
+# is the peak of the process so far.
+class StageReport:
+
+    def __init__(self):
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        _reset_peak_memory()
+        start = time.perf_counter()
+        yield
+        self.stages.append((name, time.perf_counter() - start, _peak_memory_mb()))
+        print('{:<10} {:>8.2f}s {:>10.1f} MB peak'.format(*self.stages[-1]), file=sys.stderr)
+
+
+def _reset_peak_memory():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_memory_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def file_hash(path, block=1 << 22):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(block), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# streaming version of the cleaning in Supreme_Court_Direction_Prediction.ipynb:
+# decisions after start_date, rows without a direction dropped, missing codes as 0.
+# groups numbers the cases, every justice row of a case gets the same group
+def read_features(path, start_date=START_DATE, chunksize=100000):
+    start_date = pd.Timestamp(start_date)
+    xs, ys, case_ids = [], [], []
+    reader = pd.read_csv(path, encoding='Windows-1252', usecols=list(READ_DTYPES), dtype=READ_DTYPES,
+                         chunksize=chunksize)
+    for chunk in reader:
+        dates = pd.to_datetime(chunk['dateDecision'], format='%m/%d/%Y')
+        chunk = chunk[(dates > start_date).to_numpy() & chunk['direction'].notna().to_numpy()]
+        xs.append(chunk[FEATURES].fillna(0).to_numpy(np.int32))
+        ys.append(chunk['direction'].to_numpy(np.int8))
+        case_ids.append(chunk['caseId'].to_numpy())
+
+    groups = pd.factorize(np.concatenate(case_ids))[0].astype(np.int32)
+    return np.concatenate(xs), np.concatenate(ys), groups
+
+
+# the cleaned matrix is cached as .npz keyed by the hash of the source file,
+# so retraining on an unchanged SCDB release skips parsing the csv
+def load_features(path, start_date=START_DATE, cache_dir=DEFAULT_CACHE_DIR):
+    if cache_dir is None:
+        return read_features(path, start_date)
+
+    key = '{}-{}-v{}'.format(file_hash(path)[:16], pd.Timestamp(start_date).date(), CACHE_VERSION)
+    cache_path = os.path.join(cache_dir, key + '.npz')
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            return cached['x'], cached['y'], cached['groups']
+
+    x, y, groups = read_features(path, start_date)
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(cache_path, x=x, y=y, groups=groups)
+    return x, y, groups
+
+
+# the notebook's row level split; copies of one case land on both sides
+def split(x, y, test_size=0.33, random_state=42):
+    return train_test_split(x, y, test_size=test_size, random_state=random_state)
+
+
+# whole cases go to train or test, returns the row indices of both sides
+def group_split(groups, test_size=0.33, random_state=42):
+    splitter = GroupShuffleSplit(n_splits=1, test_size=test_size, random_state=random_state)
+    return next(splitter.split(groups, groups=groups))
+
+
+# The justice centered file repeats every case once per justice with the same
+# seven features and direction. Identical (features, direction) rows collapse
+# into one row whose weight is the number of copies, which gives the trees the
+# same impurity statistics on about a ninth of the rows.
+def collapse(x, y):
+    rows = np.column_stack([x, y])
+    unique, weights = np.unique(rows, axis=0, return_counts=True)
+    return unique[:, :-1].astype(x.dtype), unique[:, -1].astype(y.dtype), weights.astype(np.float64)
+
+
+# seeded by default so retraining on the same SCDB file gives the same forest
+def fit_forest(x, y, sample_weight=None, n_estimators=2000, max_depth=12, n_jobs=-1, random_state=0):
+    classifier = RandomForestClassifier(n_estimators=n_estimators, max_depth=max_depth, n_jobs=n_jobs,
+                                        random_state=random_state)
+    # fitted on a DataFrame like the notebook, so the model keeps its feature names
+    classifier.fit(pd.DataFrame(x, columns=FEATURES), y, sample_weight=sample_weight)
+    # n_jobs is a fit time setting, the app scores single cases
+    classifier.n_jobs = None
+    return classifier
+
+
+# held out metrics per justice row, like the notebook reports them
+def evaluate(classifier, x, y):
+    proba = classifier.predict_proba(pd.DataFrame(x, columns=FEATURES))
+    return {'accuracy': accuracy_score(y, classifier.classes_[proba.argmax(axis=1)]),
+            'roc_auc': roc_auc_score(y, proba[:, 1])}
+
+
+# same layout get_classifier() reads: model.pkl inside model.zip
+def save_model(classifier, path='model.zip'):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('model.pkl', pickle.dumps(classifier, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train the supreme court direction model from the SCDB csv')
+    parser.add_argument('source', nargs='?', default=DEFAULT_SOURCE)
+    parser.add_argument('--start-date', default=START_DATE)
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--n-estimators', type=int, default=2000)
+    parser.add_argument('--max-depth', type=int, default=12)
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--random-state', type=int, default=0)
+    parser.add_argument('--model', default='model.zip')
+    parser.add_argument('--artifact', default='model.forest', help="compiled forest for the app, '' to skip")
+    args = parser.parse_args(argv)
+
+    report = StageReport()
+    with report.stage('load'):
+        x, y, groups = load_features(args.source, args.start_date, None if args.no_cache else args.cache_dir)
+        train_index, test_index = group_split(groups)
+        x_train, y_train, weights = collapse(x[train_index], y[train_index])
+
+    with report.stage('fit'):
+        classifier = fit_forest(x_train, y_train, weights, args.n_estimators, args.max_depth, args.n_jobs,
+                                args.random_state)
+
+    with report.stage('evaluate'):
+        scores = evaluate(classifier, x[test_index], y[test_index])
+
+    with report.stage('save'):
+        save_model(classifier, args.model)
+        if args.artifact:
+            from forest_engine import compile_forest
+            from model_artifact import write_artifact
+            write_artifact(compile_forest(classifier), args.artifact, source=args.model)
+
+    print('{} rows of {} cases, {} train cases as {} weighted rows, {} test cases'.format(
+        len(y), groups.max() + 1, len(np.unique(groups[train_index])), len(y_train), len(np.unique(groups[test_index]))))
+    print('test accuracy {accuracy:.4f}, roc auc {roc_auc:.4f}'.format(**scores))
+    print('total {:.2f}s'.format(sum(seconds for name, seconds, peak in report.stages)))
+
+
+if __name__ == '__main__':
+    main()